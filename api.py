@@ -1,16 +1,75 @@
+import hashlib
+import json
+
 from stacker.blueprints.base import Blueprint
-from troposphere import Output, Ref, apigateway, GetAtt, ssm
+from stacker.lookups.handlers import LookupHandler
+from troposphere import (
+    NoValue,
+    Output,
+    Ref,
+    Sub,
+    apigateway,
+    apigatewayv2,
+    awslambda,
+    GetAtt,
+    ssm,
+)
+
+SSM_API_REFERENCES = {
+    "ApiId": "/trimana/dashboard/api/id",
+    "RootResourceId": "/trimana/dashboard/api/parent/resource/id",
+    "PayrollResourceId": "/trimana/dashboard/payroll/resource/id",
+    "AlertResourceId": "/trimana/dashboard/alert/resource/id",
+    "AuthorizerId": "/trimana/dashboard/api/authorizer/id",
+}
+
+API_WIRING_OUTPUTS = {
+    "REST": {
+        "ApiId": "TrimanaDashboardApiId",
+        "RootResourceId": "TrimanaDashboardApiRootResourceId",
+        "PayrollResourceId": "TrimanaDashboardPayrollResourceId",
+        "AlertResourceId": "TwilioAlertResourceId",
+    },
+    "HTTP": {
+        "ApiId": "TrimanaDashboardApiId",
+        "AuthorizerId": "TrimanaDashboardApiAuthorizerId",
+    },
+}
+
+
+class ApiWiringLookup(LookupHandler):
+    # ${api_wiring <api stack>} resolves to the outputs of the api stack that
+    # its ApiFlavor publishes, so the ApiFlavor anchor alone picks the wiring.
+    @classmethod
+    def handle(cls, value, context=None, **kwargs):
+        api_stack = context.get_stack(value)
+        api_flavor = api_stack.definition.variables["env-dict"].get("ApiFlavor", "REST")
+        return dict(
+            (name, api_stack.outputs[output])
+            for name, output in API_WIRING_OUTPUTS[api_flavor].items()
+        )
+
+    @classmethod
+    def dependencies(cls, lookup_data):
+        if not lookup_data.resolved():
+            return set()
+        return {lookup_data.value()}
 
 
 class Trimana(Blueprint):
     VARIABLES = {"env-dict": {"type": dict}}
 
     def create_api_gateway(self):
+        report_delivery = self.get_variables()["env-dict"].get("ReportDelivery", {})
         self.api = apigateway.RestApi(
             "TrimanaDashboardApi",
             Name=self.get_variables()["env-dict"]["ApiName"],
             ApiKeySourceType="HEADER",
             EndpointConfiguration=apigateway.EndpointConfiguration(Types=["REGIONAL"]),
+            MinimumCompressionSize=report_delivery.get(
+                "MinimumCompressionSize", NoValue
+            ),
+            BinaryMediaTypes=report_delivery.get("BinaryMediaTypes", NoValue),
         )
         self.template.add_resource(self.api)
 
@@ -36,41 +95,206 @@ class Trimana(Blueprint):
                 Value=Ref(self.api),
             )
         )
+        self.create_api_outputs(
+            GetAtt(self.api, "RootResourceId"),
+            Ref(self.payroll_api_resource),
+            Ref(self.twilio_alert_api_resource),
+        )
 
-    def store_ssm_parameters(self):
-        ssm_api_id = ssm.Parameter(
-            "TrimanaDashboardApiId",
-            Name="/trimana/dashboard/api/id",
-            Type="String",
-            Value=Ref(self.api),
+    def create_health_check_method(self):
+        if not self.get_variables()["env-dict"].get("CustomDomain"):
+            return
+
+        health_api_resource = self.template.add_resource(
+            apigateway.Resource(
+                "TrimanaDashboardHealthResource",
+                ParentId=GetAtt(self.api, "RootResourceId"),
+                RestApiId=Ref(self.api),
+                PathPart="health",
+            )
         )
-        self.template.add_resource(ssm_api_id)
 
-        ssm_api_parent_resource_id = ssm.Parameter(
-            "TrimanaDashboardApiParentResourceId",
-            Name="/trimana/dashboard/api/parent/resource/id",
-            Type="String",
-            Value=GetAtt(self.api, "RootResourceId"),
+        self.template.add_resource(
+            apigateway.Method(
+                "TrimanaDashboardHealthMethod",
+                RestApiId=Ref(self.api),
+                ResourceId=Ref(health_api_resource),
+                HttpMethod="GET",
+                AuthorizationType="NONE",
+                ApiKeyRequired=False,
+                Integration=apigateway.Integration(
+                    Type="MOCK",
+                    RequestTemplates={"application/json": '{"statusCode": 200}'},
+                    IntegrationResponses=[
+                        apigateway.IntegrationResponse(
+                            StatusCode="200",
+                            ResponseTemplates={"application/json": '{"status": "ok"}'},
+                        )
+                    ],
+                ),
+                MethodResponses=[apigateway.MethodResponse(StatusCode="200")],
+            )
         )
-        self.template.add_resource(ssm_api_parent_resource_id)
 
-        ssm_payroll_resource_id = ssm.Parameter(
-            "TrimanaDashboardPayrollResourceId",
-            Name="/trimana/dashboard/payroll/resource/id",
-            Type="String",
-            Value=Ref(self.payroll_api_resource),
+    def create_http_api(self):
+        self.api = apigatewayv2.Api(
+            "TrimanaDashboardHttpApi",
+            Name=self.get_variables()["env-dict"]["ApiName"],
+            ProtocolType="HTTP",
+        )
+        self.template.add_resource(self.api)
+
+        authorizer = self.get_variables()["env-dict"]["HttpApiAuthorizer"]
+        if authorizer["Type"] == "JWT":
+            self.api_authorizer = apigatewayv2.Authorizer(
+                "TrimanaDashboardApiAuthorizer",
+                ApiId=Ref(self.api),
+                Name="TrimanaDashboardJwtAuthorizer",
+                AuthorizerType="JWT",
+                IdentitySource=["$request.header.Authorization"],
+                JwtConfiguration=apigatewayv2.JWTConfiguration(
+                    Issuer=authorizer["Issuer"],
+                    Audience=authorizer["Audience"],
+                ),
+            )
+        else:
+            self.api_authorizer = apigatewayv2.Authorizer(
+                "TrimanaDashboardApiAuthorizer",
+                ApiId=Ref(self.api),
+                Name="TrimanaDashboardLambdaAuthorizer",
+                AuthorizerType="REQUEST",
+                AuthorizerPayloadFormatVersion="2.0",
+                EnableSimpleResponses=True,
+                AuthorizerResultTtlInSeconds=authorizer.get(
+                    "ResultTtlInSeconds", 300
+                ),
+                IdentitySource=[
+                    "$request.header.%s"
+                    % authorizer.get("IdentityHeader", "x-api-key")
+                ],
+                AuthorizerUri=Sub(
+                    "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31/functions/${LambdaArn}/invocations",
+                    LambdaArn=authorizer["LambdaArn"],
+                ),
+            )
+
+            self.template.add_resource(
+                awslambda.Permission(
+                    "TrimanaDashboardApiAuthorizerInvokePermission",
+                    Action="lambda:InvokeFunction",
+                    FunctionName=authorizer["LambdaArn"],
+                    Principal="apigateway.amazonaws.com",
+                    SourceArn=Sub(
+                        "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${ApiId}/authorizers/*",
+                        ApiId=Ref(self.api),
+                    ),
+                )
+            )
+        self.template.add_resource(self.api_authorizer)
+
+        self.template.add_output(
+            Output(
+                "TrimanaDashboardApiId",
+                Value=Ref(self.api),
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "TrimanaDashboardApiAuthorizerId",
+                Value=Ref(self.api_authorizer),
+            )
         )
-        self.template.add_resource(ssm_payroll_resource_id)
 
-        ssm_twilio_alert_resource_id = ssm.Parameter(
+    def create_api_outputs(
+        self, root_resource_id, payroll_resource_id, alert_resource_id
+    ):
+        self.template.add_output(
+            Output(
+                "TrimanaDashboardApiRootResourceId",
+                Value=root_resource_id,
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "TrimanaDashboardPayrollResourceId",
+                Value=payroll_resource_id,
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "TwilioAlertResourceId",
+                Value=alert_resource_id,
+            )
+        )
+
+    def store_ssm_parameter(self, title, reference, value):
+        self.template.add_resource(
+            ssm.Parameter(
+                title,
+                Name=SSM_API_REFERENCES[reference],
+                Type="String",
+                Value=value,
+            )
+        )
+
+    def store_ssm_parameters(self):
+        self.store_ssm_parameter("TrimanaDashboardApiId", "ApiId", Ref(self.api))
+        if self.get_variables()["env-dict"].get("ApiFlavor", "REST") == "HTTP":
+            self.store_ssm_parameter(
+                "TrimanaDashboardApiAuthorizerId",
+                "AuthorizerId",
+                Ref(self.api_authorizer),
+            )
+            return
+
+        self.store_ssm_parameter(
+            "TrimanaDashboardApiParentResourceId",
+            "RootResourceId",
+            GetAtt(self.api, "RootResourceId"),
+        )
+        self.store_ssm_parameter(
+            "TrimanaDashboardPayrollResourceId",
+            "PayrollResourceId",
+            Ref(self.payroll_api_resource),
+        )
+        self.store_ssm_parameter(
             "TwilioAlertResourceId",
-            Name="/trimana/dashboard/alert/resource/id",
-            Type="String",
-            Value=Ref(self.twilio_alert_api_resource),
+            "AlertResourceId",
+            Ref(self.twilio_alert_api_resource),
+        )
+
+    def create_api_revision_output(self):
+        api_resources = dict(
+            (title, resource.to_dict())
+            for title, resource in self.template.resources.items()
+            if resource.resource_type.startswith(
+                ("AWS::ApiGateway::", "AWS::ApiGatewayV2::")
+            )
+        )
+        self.template.add_output(
+            Output(
+                "ApiRevision",
+                Value=hashlib.sha256(
+                    json.dumps(api_resources, sort_keys=True).encode()
+                ).hexdigest()[:16],
+            )
         )
-        self.template.add_resource(ssm_twilio_alert_resource_id)
 
     def create_template(self):
-        self.create_api_gateway()
-        self.store_ssm_parameters()
+        publish_ssm_parameters = self.get_variables()["env-dict"].get(
+            "PublishSsmParameters", True
+        )
+        if self.get_variables()["env-dict"].get("ApiFlavor", "REST") == "HTTP":
+            self.create_http_api()
+            if publish_ssm_parameters:
+                self.store_ssm_parameters()
+        else:
+            self.create_api_gateway()
+            self.create_health_check_method()
+            if publish_ssm_parameters:
+                self.store_ssm_parameters()
+        self.create_api_revision_output()
         return self.template
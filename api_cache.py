@@ -0,0 +1,80 @@
+import logging
+
+from canary import get_stack_output
+from route_registry import get_registry_method_settings
+from stacker.session_cache import get_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_CONTROL = {
+    "RequireAuthorization": True,
+    "UnauthorizedStrategy": "SUCCEED_WITH_RESPONSE_HEADER",
+}
+
+UNAUTHORIZED_STRATEGIES = (
+    "FAIL_WITH_403",
+    "SUCCEED_WITH_RESPONSE_HEADER",
+    "SUCCEED_WITHOUT_RESPONSE_HEADER",
+)
+
+
+def get_cache_control_operations(env_dict):
+    api_cache = env_dict["ApiCache"]
+    cache_control = dict(DEFAULT_CACHE_CONTROL, **api_cache.get("CacheControl", {}))
+    if cache_control["UnauthorizedStrategy"] not in UNAUTHORIZED_STRATEGIES:
+        raise ValueError(
+            "ApiCache CacheControl UnauthorizedStrategy must be one of %s, got %r"
+            % (
+                ", ".join(UNAUTHORIZED_STRATEGIES),
+                cache_control["UnauthorizedStrategy"],
+            )
+        )
+
+    patch_operations = []
+    cache_methods = get_registry_method_settings(
+        env_dict, api_cache["Methods"], "ApiCache Methods"
+    )
+    for method in cache_methods.values():
+        caching_path = "/%s/%s/caching" % (
+            method["Path"].replace("/", "~1"),
+            method["HttpMethod"],
+        )
+        patch_operations += [
+            {
+                "op": "replace",
+                "path": "%s/requireAuthorizationForCacheControl" % caching_path,
+                "value": str(bool(cache_control["RequireAuthorization"])).lower(),
+            },
+            {
+                "op": "replace",
+                "path": "%s/unauthorizedCacheControlHeaderStrategy" % caching_path,
+                "value": cache_control["UnauthorizedStrategy"],
+            },
+        ]
+    return patch_operations
+
+
+def apply_cache_control(
+    context, provider, stack, output, stage, settings_stack="integrations", **kwargs
+):
+    env_dict = context.get_stack(settings_stack).definition.variables["env-dict"]
+    api_cache = env_dict.get("ApiCache")
+    if not api_cache or env_dict.get("ApiFlavor", "REST") != "REST":
+        return True
+
+    rest_api_id = get_stack_output(context, provider, stack, output)
+    if not rest_api_id:
+        logger.info("No %s output on the %s stack, skipping", output, stack)
+        return True
+
+    patch_operations = get_cache_control_operations(env_dict)
+    apigateway = get_session(provider.region).client("apigateway")
+    apigateway.update_stage(
+        restApiId=rest_api_id, stageName=stage, patchOperations=patch_operations
+    )
+    logger.info(
+        "Applied cache control settings to %d cached methods of stage %s",
+        len(api_cache["Methods"]),
+        stage,
+    )
+    return True
@@ -1,24 +1,311 @@
+import hashlib
+
 from stacker.blueprints.base import Blueprint
 from troposphere import (
+    GetAtt,
+    NoValue,
     Output,
     Ref,
+    Sub,
+    cloudfront,
+    iam,
     s3,
 )
 
+CACHING_OPTIMIZED_CACHE_POLICY_ID = "658327ea-f89d-4fab-a63d-7e88639e58f6"
+
 
 class Trimana(Blueprint):
     VARIABLES = {"env-dict": {"type": dict}}
 
-    def create_template(self):
-        s3_bucket = s3.Bucket(
+    def get_lifecycle_rules(self):
+        lifecycle_rules = []
+        artifact_versioning = self.get_variables()["env-dict"].get(
+            "ArtifactVersioning"
+        )
+        if artifact_versioning:
+            lifecycle_rules.append(
+                s3.LifecycleRule(
+                    Id="LambdaArtifactNoncurrentExpiration",
+                    Prefix="lambdas/",
+                    Status="Enabled",
+                    NoncurrentVersionExpiration=s3.NoncurrentVersionExpiration(
+                        NoncurrentDays=artifact_versioning["NoncurrentDays"]
+                    ),
+                )
+            )
+
+        report_store = self.get_variables()["env-dict"].get("ReportStore")
+        if report_store:
+            lifecycle_rules += [
+                s3.LifecycleRule(
+                    Id="ReportTiering",
+                    Prefix=report_store["Prefix"],
+                    Status="Enabled",
+                    Transitions=[
+                        s3.LifecycleRuleTransition(
+                            StorageClass=transition["StorageClass"],
+                            TransitionInDays=transition["Days"],
+                        )
+                        for transition in report_store["Transitions"]
+                    ],
+                ),
+                s3.LifecycleRule(
+                    Id="TemporaryReportExpiration",
+                    Prefix=report_store["TemporaryPrefix"],
+                    Status="Enabled",
+                    ExpirationInDays=report_store["TemporaryExpirationDays"],
+                    AbortIncompleteMultipartUpload=s3.AbortIncompleteMultipartUpload(
+                        DaysAfterInitiation=1
+                    ),
+                ),
+            ]
+        return lifecycle_rules
+
+    def get_replication_configuration(self):
+        env_dict = self.get_variables()["env-dict"]
+        replication = env_dict.get("Replication")
+        if not replication:
+            return NoValue
+
+        destination_buckets = [
+            bucket_name
+            for region, bucket_name in sorted(replication["Buckets"].items())
+            if region != env_dict["Region"]
+        ]
+        replication_role = self.template.add_resource(
+            iam.Role(
+                "TrimanaDashboardReplicationRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "s3.amazonaws.com"},
+                            "Action": "sts:AssumeRole",
+                        }
+                    ],
+                },
+                Policies=[
+                    iam.Policy(
+                        PolicyName="TrimanaDashboardReplicationPolicy",
+                        PolicyDocument={
+                            "Version": "2012-10-17",
+                            "Statement": [
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "s3:GetReplicationConfiguration",
+                                        "s3:ListBucket",
+                                    ],
+                                    "Resource": "arn:aws:s3:::%s"
+                                    % env_dict["BucketName"],
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "s3:GetObjectVersionForReplication",
+                                        "s3:GetObjectVersionAcl",
+                                        "s3:GetObjectVersionTagging",
+                                    ],
+                                    "Resource": "arn:aws:s3:::%s/*"
+                                    % env_dict["BucketName"],
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "s3:ReplicateObject",
+                                        "s3:ReplicateDelete",
+                                        "s3:ReplicateTags",
+                                    ],
+                                    "Resource": [
+                                        "arn:aws:s3:::%s/*" % bucket_name
+                                        for bucket_name in destination_buckets
+                                    ],
+                                },
+                            ],
+                        },
+                    )
+                ],
+            )
+        )
+
+        rules = []
+        for bucket_name in destination_buckets:
+            for prefix in replication["Prefixes"]:
+                rules.append(
+                    s3.ReplicationConfigurationRules(
+                        Id="%s-%s" % (bucket_name, prefix.strip("/")),
+                        Priority=len(rules),
+                        Status="Enabled",
+                        Filter=s3.ReplicationRuleFilter(Prefix=prefix),
+                        DeleteMarkerReplication=s3.DeleteMarkerReplication(
+                            Status="Disabled"
+                        ),
+                        Destination=s3.ReplicationConfigurationRulesDestination(
+                            Bucket="arn:aws:s3:::%s" % bucket_name
+                        ),
+                    )
+                )
+        return s3.ReplicationConfiguration(
+            Role=GetAtt(replication_role, "Arn"),
+            Rules=rules,
+        )
+
+    def create_bucket(self):
+        lifecycle_rules = self.get_lifecycle_rules()
+        replication_configuration = self.get_replication_configuration()
+
+        self.s3_bucket = s3.Bucket(
             "TrimanaDashboardS3Bucket",
             BucketName=self.get_variables()["env-dict"]["BucketName"],
+            VersioningConfiguration=(
+                s3.VersioningConfiguration(Status="Enabled")
+                if self.get_variables()["env-dict"].get("ArtifactVersioning")
+                or self.get_variables()["env-dict"].get("Replication")
+                else NoValue
+            ),
+            LifecycleConfiguration=(
+                s3.LifecycleConfiguration(Rules=lifecycle_rules)
+                if lifecycle_rules
+                else NoValue
+            ),
+            ReplicationConfiguration=replication_configuration,
         )
-        self.template.add_resource(s3_bucket)
+        self.template.add_resource(self.s3_bucket)
 
         self.template.add_output(
             Output(
                 "BucketName",
-                Value=Ref(s3_bucket),
+                Value=Ref(self.s3_bucket),
+            )
+        )
+
+    def create_report_distribution(self):
+        report_store = self.get_variables()["env-dict"].get("ReportStore")
+        if not report_store or not report_store.get("SignerPublicKey"):
+            return
+
+        signer_public_key = self.template.add_resource(
+            cloudfront.PublicKey(
+                "TrimanaDashboardReportsSignerPublicKey",
+                PublicKeyConfig=cloudfront.PublicKeyConfig(
+                    CallerReference=hashlib.sha256(
+                        report_store["SignerPublicKey"].encode()
+                    ).hexdigest()[:32],
+                    EncodedKey=report_store["SignerPublicKey"],
+                    Name=Sub(
+                        "${BucketName}-reports-signer",
+                        BucketName=Ref(self.s3_bucket),
+                    ),
+                ),
+            )
+        )
+
+        signer_key_group = self.template.add_resource(
+            cloudfront.KeyGroup(
+                "TrimanaDashboardReportsKeyGroup",
+                KeyGroupConfig=cloudfront.KeyGroupConfig(
+                    Name=Sub(
+                        "${BucketName}-reports",
+                        BucketName=Ref(self.s3_bucket),
+                    ),
+                    Items=[Ref(signer_public_key)],
+                ),
             )
         )
+
+        origin_access_control = self.template.add_resource(
+            cloudfront.OriginAccessControl(
+                "TrimanaDashboardReportsOriginAccessControl",
+                OriginAccessControlConfig=cloudfront.OriginAccessControlConfig(
+                    Name=Sub(
+                        "${BucketName}-reports",
+                        BucketName=Ref(self.s3_bucket),
+                    ),
+                    OriginAccessControlOriginType="s3",
+                    SigningBehavior="always",
+                    SigningProtocol="sigv4",
+                ),
+            )
+        )
+
+        reports_distribution = self.template.add_resource(
+            cloudfront.Distribution(
+                "TrimanaDashboardReportsDistribution",
+                DistributionConfig=cloudfront.DistributionConfig(
+                    Comment="Trimana Dashboard precomputed reports",
+                    Enabled=True,
+                    HttpVersion="http2and3",
+                    PriceClass=report_store.get("PriceClass", "PriceClass_100"),
+                    Origins=[
+                        cloudfront.Origin(
+                            Id="TrimanaDashboardReportsOrigin",
+                            DomainName=GetAtt(self.s3_bucket, "RegionalDomainName"),
+                            OriginAccessControlId=GetAtt(origin_access_control, "Id"),
+                            S3OriginConfig=cloudfront.S3OriginConfig(
+                                OriginAccessIdentity=""
+                            ),
+                        )
+                    ],
+                    DefaultCacheBehavior=cloudfront.DefaultCacheBehavior(
+                        TargetOriginId="TrimanaDashboardReportsOrigin",
+                        ViewerProtocolPolicy="redirect-to-https",
+                        AllowedMethods=["GET", "HEAD"],
+                        CachedMethods=["GET", "HEAD"],
+                        CachePolicyId=CACHING_OPTIMIZED_CACHE_POLICY_ID,
+                        Compress=True,
+                        TrustedKeyGroups=[Ref(signer_key_group)],
+                    ),
+                ),
+            )
+        )
+
+        self.template.add_resource(
+            s3.BucketPolicy(
+                "TrimanaDashboardS3BucketPolicy",
+                Bucket=Ref(self.s3_bucket),
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "cloudfront.amazonaws.com"},
+                            "Action": ["s3:GetObject"],
+                            "Resource": Sub(
+                                "arn:aws:s3:::${BucketName}/${Prefix}*",
+                                BucketName=Ref(self.s3_bucket),
+                                Prefix=report_store["Prefix"],
+                            ),
+                            "Condition": {
+                                "StringEquals": {
+                                    "AWS:SourceArn": Sub(
+                                        "arn:aws:cloudfront::${AWS::AccountId}:distribution/${DistributionId}",
+                                        DistributionId=Ref(reports_distribution),
+                                    )
+                                }
+                            },
+                        }
+                    ],
+                },
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "ReportsDistributionDomainName",
+                Value=GetAtt(reports_distribution, "DomainName"),
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "ReportsSignerPublicKeyId",
+                Value=Ref(signer_public_key),
+            )
+        )
+
+    def create_template(self):
+        self.create_bucket()
+        self.create_report_distribution()
+        return self.template
@@ -0,0 +1,180 @@
+import logging
+import time
+
+from botocore.exceptions import ClientError
+from stacker.exceptions import StackDoesNotExist
+from stacker.session_cache import get_session
+
+logger = logging.getLogger(__name__)
+
+
+def get_alarms_in_alarm(cloudwatch, alarm_names):
+    alarms = cloudwatch.describe_alarms(AlarmNames=alarm_names)
+    return [
+        alarm["AlarmName"]
+        for alarm in alarms["MetricAlarms"] + alarms.get("CompositeAlarms", [])
+        if alarm["StateValue"] == "ALARM"
+    ]
+
+
+def get_stack_output(context, provider, stack, output):
+    try:
+        api_stack = provider.get_stack(context.get_stack(stack).fqn)
+    except StackDoesNotExist:
+        return None
+    return provider.get_output_dict(api_stack).get(output)
+
+
+def get_api_stage_deployment(context, provider, stack, output, stage, **kwargs):
+    rest_api_id = get_stack_output(context, provider, stack, output)
+    if not rest_api_id:
+        return {"deployment_id": ""}
+
+    apigateway = get_session(provider.region).client("apigateway")
+    try:
+        api_stage = apigateway.get_stage(restApiId=rest_api_id, stageName=stage)
+    except ClientError:
+        return {"deployment_id": ""}
+    return {"deployment_id": api_stage["deploymentId"]}
+
+
+def delete_unused_api_deployments(
+    context, provider, apigateway, rest_api_id, deployment_stack
+):
+    in_use = set()
+    for api_stage in apigateway.get_stages(restApiId=rest_api_id)["item"]:
+        in_use.add(api_stage.get("deploymentId"))
+        in_use.add(api_stage.get("canarySettings", {}).get("deploymentId"))
+
+    cloudformation = get_session(provider.region).client("cloudformation")
+    paginator = cloudformation.get_paginator("list_stack_resources")
+    for page in paginator.paginate(StackName=context.get_stack(deployment_stack).fqn):
+        for resource in page["StackResourceSummaries"]:
+            if resource["ResourceType"] == "AWS::ApiGateway::Deployment":
+                in_use.add(resource.get("PhysicalResourceId"))
+
+    paginator = apigateway.get_paginator("get_deployments")
+    for page in paginator.paginate(restApiId=rest_api_id):
+        for deployment in page["items"]:
+            if deployment["id"] in in_use or not deployment.get(
+                "description", ""
+            ).startswith("API revision "):
+                continue
+            logger.info("Deleting unused API deployment %s", deployment["id"])
+            apigateway.delete_deployment(
+                restApiId=rest_api_id, deploymentId=deployment["id"]
+            )
+
+
+def bake_api_canary(
+    session, apigateway, rest_api_id, stage, alarm_names, bake_seconds, poll_seconds
+):
+    try:
+        api_stage = apigateway.get_stage(restApiId=rest_api_id, stageName=stage)
+    except ClientError:
+        logger.info("No stage %s/%s, nothing to promote", rest_api_id, stage)
+        return True
+    canary_settings = api_stage.get("canarySettings")
+    if not canary_settings:
+        logger.info("No canary on %s/%s, nothing to promote", rest_api_id, stage)
+        return True
+    if canary_settings.get("deploymentId") == api_stage["deploymentId"]:
+        logger.info("Canary on %s/%s is already live", rest_api_id, stage)
+        apigateway.update_stage(
+            restApiId=rest_api_id,
+            stageName=stage,
+            patchOperations=[{"op": "remove", "path": "/canarySettings"}],
+        )
+        return True
+
+    fired = []
+    if not alarm_names:
+        fired = ["no canary alarms are published"]
+    else:
+        logger.info(
+            "Baking canary deployment %s at %s%% for %ss against %s",
+            canary_settings["deploymentId"],
+            canary_settings.get("percentTraffic", 0),
+            bake_seconds,
+            ", ".join(alarm_names),
+        )
+        cloudwatch = session.client("cloudwatch")
+        deadline = time.time() + bake_seconds
+        while True:
+            fired = get_alarms_in_alarm(cloudwatch, alarm_names)
+            if fired or time.time() >= deadline:
+                break
+            time.sleep(min(poll_seconds, max(deadline - time.time(), 0)))
+
+    if fired:
+        logger.error(
+            "Rolling back canary deployment %s: %s",
+            canary_settings["deploymentId"],
+            ", ".join(fired),
+        )
+        apigateway.update_stage(
+            restApiId=rest_api_id,
+            stageName=stage,
+            patchOperations=[{"op": "remove", "path": "/canarySettings"}],
+        )
+        return False
+
+    logger.info("Promoting canary deployment %s", canary_settings["deploymentId"])
+    apigateway.update_stage(
+        restApiId=rest_api_id,
+        stageName=stage,
+        patchOperations=[
+            {
+                "op": "copy",
+                "from": "/canarySettings/deploymentId",
+                "path": "/deploymentId",
+            },
+            {"op": "remove", "path": "/canarySettings"},
+        ],
+    )
+    return True
+
+
+def promote_api_canary(
+    context,
+    provider,
+    stack,
+    output,
+    stage,
+    deployment_stack,
+    alarm_output="ApiCanaryAlarmNames",
+    bake_seconds=600,
+    poll_seconds=30,
+    **kwargs
+):
+    # The HTTP flavor has no REST stage or deployments to canary.
+    env_dict = context.get_stack(deployment_stack).definition.variables["env-dict"]
+    if env_dict.get("ApiFlavor", "REST") != "REST":
+        return True
+
+    rest_api_id = get_stack_output(context, provider, stack, output)
+    if not rest_api_id:
+        return True
+
+    alarm_names = [
+        alarm_name
+        for alarm_name in (
+            get_stack_output(context, provider, deployment_stack, alarm_output) or ""
+        ).split(",")
+        if alarm_name
+    ]
+    session = get_session(provider.region)
+    apigateway = session.client("apigateway")
+    promoted = bake_api_canary(
+        session,
+        apigateway,
+        rest_api_id,
+        stage,
+        alarm_names,
+        bake_seconds,
+        poll_seconds,
+    )
+    delete_unused_api_deployments(
+        context, provider, apigateway, rest_api_id, deployment_stack
+    )
+    return promoted
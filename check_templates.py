@@ -0,0 +1,201 @@
+import argparse
+import difflib
+import json
+import os
+import statistics
+import sys
+import time
+
+from stacker.config import render_parse_load
+from stacker.context import Context
+from stacker.environment import parse_environment
+from stacker.variables import resolve_variables
+
+CLOUDFORMATION_LIMITS = {
+    "bytes": 1000000,
+    "resources": 500,
+    "outputs": 200,
+    "parameters": 200,
+}
+
+
+class OfflineHookData(dict):
+    def __missing__(self, key):
+        return ""
+
+
+class OfflineOutputs(dict):
+    def __init__(self, stack_name):
+        super(OfflineOutputs, self).__init__()
+        self.stack_name = stack_name
+
+    def __missing__(self, key):
+        return "%s::%s" % (self.stack_name, key)
+
+
+class OfflineProvider(object):
+    def __init__(self, region):
+        self.region = region
+
+
+def load_context(config_path, environment_path):
+    with open(environment_path) as environment_file:
+        environment = parse_environment(environment_file.read())
+    with open(config_path) as config_file:
+        config = render_parse_load(config_file.read(), environment=environment)
+    context = Context(environment=environment, config=config)
+    for hook in list(config.pre_build or []) + list(config.post_build or []):
+        if hook.data_key:
+            context.set_hook_data(hook.data_key, OfflineHookData())
+    for stack in context.get_stacks():
+        stack.set_outputs(OfflineOutputs(stack.name))
+    return context
+
+
+def render_stack(context, provider, stack):
+    resolve_variables(stack.variables, context, provider)
+    blueprint = stack.blueprint.__class__(
+        stack.name, context, mappings=context.mappings
+    )
+    blueprint.resolve_variables(stack.variables)
+    _, rendered = blueprint.render_template()
+    return rendered
+
+
+def canonical_template(rendered):
+    return json.dumps(json.loads(rendered), indent=2, sort_keys=True) + "\n"
+
+
+def get_template_usage(rendered):
+    template = json.loads(rendered)
+    return {
+        "bytes": len(rendered.encode()),
+        "resources": len(template.get("Resources", {})),
+        "outputs": len(template.get("Outputs", {})),
+        "parameters": len(template.get("Parameters", {})),
+    }
+
+
+def check_budgets(usage, budget):
+    failures = []
+    for name, limit in sorted(CLOUDFORMATION_LIMITS.items()):
+        allowed = int(limit * budget)
+        if usage[name] > allowed:
+            failures.append(
+                "%s %d exceeds budget %d (%d%% of the CloudFormation limit %d)"
+                % (name, usage[name], allowed, budget * 100, limit)
+            )
+    return failures
+
+
+def check_snapshot(snapshot_path, template, update):
+    if update:
+        with open(snapshot_path, "w") as snapshot_file:
+            snapshot_file.write(template)
+        return []
+
+    if not os.path.exists(snapshot_path):
+        return ["no snapshot at %s, run with --update" % snapshot_path]
+
+    with open(snapshot_path) as snapshot_file:
+        snapshot = snapshot_file.read()
+    if snapshot == template:
+        return []
+
+    diff = list(
+        difflib.unified_diff(
+            snapshot.splitlines(),
+            template.splitlines(),
+            snapshot_path,
+            "rendered",
+            lineterm="",
+        )
+    )
+    return ["template differs from snapshot:"] + diff[:200]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render every stack offline and check it against its snapshot, "
+        "CloudFormation size budgets and render time."
+    )
+    parser.add_argument("stacks", nargs="*", help="only check these stacks")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--environment", default="environments/us-west-2.env")
+    parser.add_argument(
+        "--snapshot-dir",
+        help="defaults to snapshots/<environment name>",
+    )
+    parser.add_argument("--update", action="store_true", help="rewrite snapshots")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.8,
+        help="fraction of each CloudFormation limit a template may use",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="renders per stack")
+    parser.add_argument(
+        "--max-render-seconds",
+        type=float,
+        default=2.0,
+        help="fail when the median render time of a stack exceeds this",
+    )
+    args = parser.parse_args(argv)
+
+    context = load_context(args.config, args.environment)
+    provider = OfflineProvider(context.config.stacker_bucket_region)
+    snapshot_dir = args.snapshot_dir or os.path.join(
+        "snapshots", os.path.splitext(os.path.basename(args.environment))[0]
+    )
+    if not os.path.isdir(snapshot_dir):
+        os.makedirs(snapshot_dir)
+
+    failed = False
+    print(
+        "%-16s %10s %10s %8s %8s %12s"
+        % ("stack", "bytes", "resources", "outputs", "params", "render ms")
+    )
+    for stack in context.get_stacks():
+        if args.stacks and stack.name not in args.stacks:
+            continue
+
+        render_times = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            rendered = render_stack(context, provider, stack)
+            render_times.append(time.perf_counter() - started)
+        render_time = statistics.median(render_times)
+
+        usage = get_template_usage(rendered)
+        print(
+            "%-16s %10d %10d %8d %8d %12.1f"
+            % (
+                stack.name,
+                usage["bytes"],
+                usage["resources"],
+                usage["outputs"],
+                usage["parameters"],
+                render_time * 1000,
+            )
+        )
+
+        failures = check_budgets(usage, args.budget)
+        if render_time > args.max_render_seconds:
+            failures.append(
+                "median render time %.2fs exceeds %.2fs"
+                % (render_time, args.max_render_seconds)
+            )
+        failures += check_snapshot(
+            os.path.join(snapshot_dir, "%s.json" % stack.name),
+            canonical_template(rendered),
+            args.update,
+        )
+        for failure in failures:
+            print("  %s" % failure)
+        failed = failed or bool(failures)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
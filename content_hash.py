@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+
+from botocore.exceptions import ClientError
+from route_registry import get_route_artifacts
+from stacker.exceptions import (
+    FailedVariableLookup,
+    OutputDoesNotExist,
+    StackDoesNotExist,
+    UnresolvedVariable,
+)
+from stacker.session_cache import get_session
+from stacker.variables import resolve_variables
+
+logger = logging.getLogger(__name__)
+
+DIGEST_PREFIX = "stack-digests"
+
+BUILT_STATUSES = ("CREATE_COMPLETE", "UPDATE_COMPLETE")
+
+
+def lambda_artifact_versions(
+    context, provider, bucket, artifacts=None, stack=None, **kwargs
+):
+    artifacts = dict(artifacts or {})
+    if stack:
+        artifacts.update(
+            get_route_artifacts(
+                context.get_stack(stack).definition.variables["env-dict"]
+            )
+        )
+
+    s3_client = get_session(provider.region).client("s3")
+    versions = {}
+    for lambda_name, key in artifacts.items():
+        try:
+            artifact = s3_client.head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            logger.info("No artifact at s3://%s/%s, leaving it unpinned", bucket, key)
+            versions[lambda_name] = ""
+            continue
+        version_id = artifact.get("VersionId", "null")
+        versions[lambda_name] = "" if version_id == "null" else version_id
+    return {"versions": versions}
+
+
+def render_stack_digest(context, provider, stack):
+    resolve_variables(stack.variables, context, provider)
+    blueprint = stack.blueprint.__class__(
+        stack.name, context, mappings=context.mappings
+    )
+    blueprint.resolve_variables(stack.variables)
+    _, rendered = blueprint.render_template()
+
+    digest = hashlib.sha256()
+    digest.update(rendered.encode())
+    digest.update(json.dumps(stack.tags, sort_keys=True).encode())
+    digest.update((stack.stack_policy or "").encode())
+    return digest.hexdigest()
+
+
+def get_digest_key(stack):
+    return "%s/%s.sha256" % (DIGEST_PREFIX, stack.fqn)
+
+
+def get_stored_digest(s3_client, bucket, stack):
+    try:
+        stored = s3_client.get_object(Bucket=bucket, Key=get_digest_key(stack))
+    except ClientError:
+        return None
+    return stored["Body"].read().decode()
+
+
+def lock_unchanged_stacks(context, provider, **kwargs):
+    s3_client = get_session(provider.region).client("s3")
+    stacks = dict((stack.name, stack) for stack in context.get_stacks())
+
+    deployed = set()
+    for stack in stacks.values():
+        try:
+            provider_stack = provider.get_stack(stack.fqn)
+        except StackDoesNotExist:
+            continue
+        stack.set_outputs(provider.get_output_dict(provider_stack))
+        deployed.add(stack.name)
+
+    unchanged = set()
+    for stack in stacks.values():
+        if stack.force or stack.name not in deployed:
+            continue
+        try:
+            digest = render_stack_digest(context, provider, stack)
+        except (
+            FailedVariableLookup,
+            OutputDoesNotExist,
+            StackDoesNotExist,
+            UnresolvedVariable,
+        ) as e:
+            logger.info("Could not render %s offline, building it: %s", stack.name, e)
+            continue
+        if digest == get_stored_digest(s3_client, context.bucket_name, stack):
+            unchanged.add(stack.name)
+
+    def is_unchanged(name):
+        return name in unchanged and all(
+            is_unchanged(required) for required in stacks[name].requires
+        )
+
+    locked = []
+    for stack in stacks.values():
+        if is_unchanged(stack.name):
+            stack.locked = True
+            locked.append(stack.name)
+
+    logger.info("Skipping unchanged stacks: %s", ", ".join(locked) or "none")
+    return {"locked": ",".join(locked)}
+
+
+def get_run_stack_names(context):
+    # The stacks stacker walked in this run: every stack, or with --targets
+    # and --stacks the named steps and everything they depend on, following
+    # the same requires/required_by edges as the plan graph.
+    stacks = context.get_stacks()
+    if not context.stack_names:
+        return set(stack.name for stack in stacks)
+
+    steps = dict((step.name, step) for step in stacks + context.get_targets())
+    dependencies = dict((name, set(step.requires)) for name, step in steps.items())
+    for name, step in steps.items():
+        for parent in step.required_by:
+            dependencies.setdefault(parent, set()).add(name)
+
+    selected = set()
+    pending = list(context.stack_names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies.get(name, ()))
+    return selected
+
+
+def record_stack_digests(context, provider, **kwargs):
+    # Only stacks this run created or updated get a digest. A locked, disabled
+    # or untargeted stack keeps its old digest, so a change to it is still
+    # seen as a change on the next build.
+    s3_client = get_session(provider.region).client("s3")
+    run_stack_names = get_run_stack_names(context)
+
+    recorded = []
+    for stack in context.get_stacks():
+        if stack.name not in run_stack_names or not stack.enabled:
+            continue
+        if stack.locked and not stack.force:
+            continue
+        try:
+            provider_stack = provider.get_stack(stack.fqn)
+        except StackDoesNotExist:
+            continue
+        if provider.get_stack_status(provider_stack) not in BUILT_STATUSES:
+            continue
+        s3_client.put_object(
+            Bucket=context.bucket_name,
+            Key=get_digest_key(stack),
+            Body=render_stack_digest(context, provider, stack).encode(),
+        )
+        recorded.append(stack.name)
+
+    logger.info("Recorded digests for stacks: %s", ", ".join(recorded) or "none")
+    return True
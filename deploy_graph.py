@@ -0,0 +1,435 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+from botocore.exceptions import ClientError
+from stacker.actions import build
+from stacker.config import render_parse_load
+from stacker.context import Context
+from stacker.environment import parse_environment
+from stacker.exceptions import PlanFailed
+from stacker.providers.aws.default import ProviderBuilder
+from stacker.session_cache import get_session
+from stacker.status import FAILED, CompleteStatus, FailedStatus, SkippedStatus
+from stacker.variables import resolve_variables
+
+from api import SSM_API_REFERENCES
+
+SSM_DYNAMIC_REFERENCE = re.compile(r"\{\{resolve:ssm:([^:}]+)")
+
+STAND_IN_REFERENCES = {
+    "AWS::Lambda::Alias": "FunctionName",
+}
+
+SUB_REFERENCE = re.compile(r"\$\{([A-Za-z0-9]+(?:\.[A-Za-z0-9.]+)?)\}")
+
+PHASES = ("create", "update")
+
+
+class StandInBlueprint(object):
+    def __init__(self, blueprint, rendered):
+        self.blueprint = blueprint
+        self.rendered = rendered
+        self.version = hashlib.md5(rendered.encode()).hexdigest()[:8]
+
+    def __getattr__(self, name):
+        return getattr(self.blueprint, name)
+
+
+class TimedBuildAction(build.Action):
+    def __init__(self, modelled_types, *args, **kwargs):
+        super(TimedBuildAction, self).__init__(*args, **kwargs)
+        self.modelled_types = modelled_types
+        self.started = {}
+        self.timings = {}
+
+    def _template(self, blueprint):
+        return super(TimedBuildAction, self)._template(
+            StandInBlueprint(
+                blueprint,
+                get_stand_in_template(blueprint.rendered, self.modelled_types),
+            )
+        )
+
+    def _launch_stack(self, stack, **kwargs):
+        self.started.setdefault(stack.name, time.perf_counter())
+        try:
+            status = super(TimedBuildAction, self)._launch_stack(stack, **kwargs)
+        except Exception:
+            self.record_timing(stack, FAILED)
+            raise
+        if isinstance(status, (CompleteStatus, SkippedStatus, FailedStatus)):
+            self.record_timing(stack, status)
+        return status
+
+    def record_timing(self, stack, status):
+        self.timings[stack.name] = {
+            "seconds": time.perf_counter() - self.started[stack.name],
+            "status": status.name,
+        }
+
+
+def get_modelled_types(moto_python):
+    try:
+        output = subprocess.check_output(
+            [
+                moto_python,
+                "-c",
+                "import json; from moto.cloudformation.parsing import get_model_map; "
+                "print(json.dumps(sorted(get_model_map())))",
+            ]
+        )
+    except (OSError, subprocess.CalledProcessError):
+        raise SystemExit(
+            "moto is not importable by %s, run pip install 'moto[server]' in a "
+            "separate virtualenv and pass its interpreter with --moto-python"
+            % moto_python
+        )
+    return set(json.loads(output))
+
+
+def get_unmodelled_types(rendered, modelled_types):
+    return sorted(
+        set(
+            resource["Type"]
+            for resource in json.loads(rendered).get("Resources", {}).values()
+            if resource["Type"] not in modelled_types
+        )
+    )
+
+
+def replace_unmodelled(value, unmodelled):
+    if isinstance(value, list):
+        return [replace_unmodelled(item, unmodelled) for item in value]
+    if isinstance(value, str):
+        return SUB_REFERENCE.sub(
+            lambda match: (
+                "stand-in:%s" % match.group(1)
+                if match.group(1).split(".")[0] in unmodelled
+                else match.group(0)
+            ),
+            value,
+        )
+    if not isinstance(value, dict):
+        return value
+    if value.get("Ref") in unmodelled:
+        return unmodelled[value["Ref"]] or "stand-in:%s" % value["Ref"]
+    attribute = value.get("Fn::GetAtt")
+    if attribute and attribute[0] in unmodelled:
+        return "stand-in:%s.%s" % tuple(attribute)
+    return dict(
+        (key, item if key == "Ref" else replace_unmodelled(item, unmodelled))
+        for key, item in value.items()
+    )
+
+
+def get_stand_in_template(rendered, modelled_types):
+    template = json.loads(rendered)
+    unmodelled = dict(
+        (
+            title,
+            resource.get("Properties", {}).get(
+                STAND_IN_REFERENCES.get(resource["Type"])
+            ),
+        )
+        for title, resource in template.get("Resources", {}).items()
+        if resource["Type"] not in modelled_types
+    )
+    if not unmodelled:
+        return rendered
+    for title, reference in unmodelled.items():
+        unmodelled[title] = replace_unmodelled(reference, {})
+
+    resources = {}
+    for title, resource in template["Resources"].items():
+        if title in unmodelled:
+            continue
+        depends_on = resource.get("DependsOn")
+        if depends_on:
+            depends_on = [
+                name
+                for name in (
+                    [depends_on] if isinstance(depends_on, str) else depends_on
+                )
+                if name not in unmodelled
+            ]
+            resource = dict(resource, DependsOn=depends_on)
+            if not depends_on:
+                del resource["DependsOn"]
+        resources[title] = replace_unmodelled(resource, unmodelled)
+    template["Resources"] = resources
+    template["Outputs"] = replace_unmodelled(template.get("Outputs", {}), unmodelled)
+    return json.dumps(template)
+
+
+def start_moto_server(moto_python, port):
+    server = subprocess.Popen(
+        [moto_python, "-m", "moto.server", "-H", "localhost", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("moto server did not start on port %d" % port)
+
+
+def use_endpoint(endpoint_url, region):
+    os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+    os.environ["AWS_DEFAULT_REGION"] = region
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    for name in ("AWS_PROFILE", "AWS_SESSION_TOKEN"):
+        os.environ.pop(name, None)
+
+
+def load_context(config_path, environment_path):
+    with open(environment_path) as environment_file:
+        environment = parse_environment(environment_file.read())
+    with open(config_path) as config_file:
+        config = render_parse_load(config_file.read(), environment=environment)
+    return Context(environment=environment, config=config)
+
+
+def deploy(context, region, concurrency, modelled_types):
+    action = TimedBuildAction(
+        modelled_types,
+        context=context,
+        provider_builder=ProviderBuilder(
+            region=region, interactive=False, recreate_failed=True
+        ),
+    )
+    try:
+        action.pre_run()
+        action.run(concurrency=concurrency, tail=False)
+        action.post_run()
+    except PlanFailed as e:
+        print(str(e))
+    return action
+
+
+def get_longest_paths(stacks, weights):
+    longest = {}
+
+    def walk(name):
+        if name not in longest:
+            required = [walk(other) for other in stacks[name].requires]
+            weight, path = max(required, key=lambda item: item[0], default=(0, []))
+            longest[name] = (weight + weights.get(name, 0), path + [name])
+        return longest[name]
+
+    for name in stacks:
+        walk(name)
+    return longest
+
+
+def get_critical_path(stacks, weights):
+    return max(get_longest_paths(stacks, weights).values(), key=lambda item: item[0])
+
+
+def get_ssm_parameter(ssm_client, name):
+    try:
+        return ssm_client.get_parameter(Name=name)["Parameter"]["Value"]
+    except ClientError:
+        return None
+
+
+def check_wiring(context, provider, stacks):
+    ssm_client = get_session(provider.region).client("ssm")
+    failures = []
+    for stack in stacks:
+        outputs = provider.get_output_dict(provider.get_stack(stack.fqn))
+        for key, value in sorted(outputs.items()):
+            if not value:
+                failures.append("%s output %s is empty" % (stack.name, key))
+
+        for name in sorted(
+            set(SSM_DYNAMIC_REFERENCE.findall(stack.blueprint.rendered))
+        ):
+            if get_ssm_parameter(ssm_client, name) is None:
+                failures.append(
+                    "%s resolves SSM parameter %s, which does not exist"
+                    % (stack.name, name)
+                )
+
+        resolve_variables(stack.variables, context, provider)
+        env_dict = dict(
+            (variable.name, variable.value) for variable in stack.variables
+        ).get("env-dict", {})
+        for key, value in sorted(env_dict.get("ApiWiring", {}).items()):
+            published = get_ssm_parameter(ssm_client, SSM_API_REFERENCES[key])
+            if published is not None and published != value:
+                failures.append(
+                    "%s ApiWiring %s is %r but SSM %s is %r"
+                    % (stack.name, key, value, SSM_API_REFERENCES[key], published)
+                )
+    return failures
+
+
+def check_baseline(baseline_path, results, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    failures = []
+    for phase in PHASES:
+        allowed = baseline[phase]["critical_path_seconds"] * (1 + tolerance)
+        seconds = results[phase]["critical_path_seconds"]
+        if seconds > allowed:
+            failures.append(
+                "%s critical path %.2fs exceeds baseline %.2fs by more than %d%%"
+                % (
+                    phase,
+                    seconds,
+                    baseline[phase]["critical_path_seconds"],
+                    tolerance * 100,
+                )
+            )
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Deploy every stack into a local moto server, then update it, "
+        "and report the wiring between stacks and per-stack build times."
+    )
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--environment", default="environments/us-west-2.env")
+    parser.add_argument(
+        "--moto-python",
+        default=sys.executable,
+        help="interpreter of a virtualenv with moto[server] installed, kept "
+        "apart because moto and stacker pin conflicting jinja2 versions",
+    )
+    parser.add_argument(
+        "--endpoint-url", help="use a running moto server instead of starting one"
+    )
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--poll-seconds",
+        type=float,
+        default=0.5,
+        help="how often stack status is polled, stacker polls every 30s by default",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=0,
+        help="stacks built at once, 0 walks the graph as fast as it allows",
+    )
+    parser.add_argument("--output", help="write the timings to this JSON file")
+    parser.add_argument("--baseline", help="timings JSON from an earlier --output")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="fraction a critical path may exceed its baseline by",
+    )
+    args = parser.parse_args(argv)
+
+    context = load_context(args.config, args.environment)
+    region = context.config.stacker_bucket_region
+    build.STACK_POLL_TIME = args.poll_seconds
+    modelled_types = get_modelled_types(args.moto_python)
+    server = None
+    if not args.endpoint_url:
+        server = start_moto_server(args.moto_python, args.port)
+    use_endpoint(args.endpoint_url or "http://localhost:%d" % args.port, region)
+
+    try:
+        results = {}
+        for phase in PHASES:
+            context = load_context(args.config, args.environment)
+            context.config.tags = dict(context.tags, **{"deploy-graph-run": phase})
+            action = deploy(context, region, args.concurrency, modelled_types)
+            stacks = dict((stack.name, stack) for stack in context.get_stacks())
+            weight, path = get_critical_path(
+                stacks,
+                dict(
+                    (name, timing["seconds"]) for name, timing in action.timings.items()
+                ),
+            )
+            results[phase] = {
+                "stacks": action.timings,
+                "critical_path": path,
+                "critical_path_seconds": weight,
+            }
+        failures = check_wiring(
+            context,
+            action.provider,
+            [
+                stacks[name]
+                for name, timing in sorted(action.timings.items())
+                if timing["status"] == "complete"
+            ],
+        )
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    depths = get_longest_paths(stacks, dict((name, 1) for name in stacks))
+    depth = max(stack_depth for stack_depth, _ in depths.values())
+    print(
+        "%-16s %6s %10s %10s %10s"
+        % ("stack", "depth", "create s", "update s", "status")
+    )
+    for name in stacks:
+        print(
+            "%-16s %6d %10.2f %10.2f %10s"
+            % (
+                name,
+                depths[name][0],
+                results["create"]["stacks"].get(name, {}).get("seconds", 0),
+                results["update"]["stacks"].get(name, {}).get("seconds", 0),
+                results["update"]["stacks"].get(name, {}).get("status", "not run"),
+            )
+        )
+    print("critical path depth %d" % depth)
+    for name, timing in sorted(results["create"]["stacks"].items()):
+        if timing["status"] != "complete":
+            continue
+        unmodelled_types = get_unmodelled_types(
+            stacks[name].blueprint.rendered, modelled_types
+        )
+        if unmodelled_types:
+            print(
+                "%s: not modelled by the stand-in: %s"
+                % (name, ", ".join(unmodelled_types))
+            )
+    for phase in PHASES:
+        print(
+            "%s critical path %.2fs: %s"
+            % (
+                phase,
+                results[phase]["critical_path_seconds"],
+                " -> ".join(results[phase]["critical_path"]),
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(dict(results, depth=depth), output_file, indent=2, sort_keys=True)
+            output_file.write("\n")
+    if args.baseline:
+        failures += check_baseline(args.baseline, results, args.tolerance)
+    for phase in PHASES:
+        for name, timing in sorted(results[phase]["stacks"].items()):
+            if timing["status"] == "failed":
+                failures.append("%s %s failed" % (phase, name))
+    for failure in failures:
+        print("  %s" % failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,634 @@
+import hashlib
+import json
+
+from api import SSM_API_REFERENCES
+from route_registry import get_registry_method_settings, get_routes
 from stacker.blueprints.base import Blueprint
 from troposphere import (
+    GetAtt,
+    Join,
+    Output,
     Ref,
+    NoValue,
+    Sub,
+    Tags,
     apigateway,
+    apigatewayv2,
+    certificatemanager,
+    cloudwatch,
+    iam,
+    logs,
+    route53,
+)
+
+DEFAULT_ROUTE_THRESHOLDS = {
+    "Latencyp95Ms": 3000,
+    "Latencyp99Ms": 8000,
+    "ServerErrorThreshold": 5,
+}
+
+ACCESS_LOG_FORMAT = json.dumps(
+    {
+        "requestId": "$context.requestId",
+        "sourceIp": "$context.identity.sourceIp",
+        "requestTime": "$context.requestTime",
+        "httpMethod": "$context.httpMethod",
+        "path": "$context.path",
+        "status": "$context.status",
+        "responseLength": "$context.responseLength",
+        "responseLatency": "$context.responseLatency",
+        "integrationLatency": "$context.integrationLatency",
+        "apiKeyId": "$context.identity.apiKeyId",
+    }
 )
 
 
 class Trimana(Blueprint):
     VARIABLES = {"env-dict": {"type": dict}}
 
-    def create_template(self):
-        trimana_dashboard_api_deoployment = self.template.add_resource(
+    def get_cache_method_settings(self):
+        env_dict = self.get_variables()["env-dict"]
+        cache_methods = get_registry_method_settings(
+            env_dict, env_dict["ApiCache"]["Methods"], "ApiCache Methods"
+        )
+        observability = self.get_variables()["env-dict"].get("Observability")
+        return [
+            apigateway.MethodSetting(
+                ResourcePath="/" + method["Path"].replace("/", "~1"),
+                HttpMethod=method["HttpMethod"],
+                CachingEnabled=True,
+                CacheTtlInSeconds=method["TtlInSeconds"],
+                MetricsEnabled=bool(observability),
+            )
+            for method in cache_methods.values()
+        ]
+
+    def get_route_throttling(self, route_throttling, settings_name="RouteThrottling"):
+        return get_registry_method_settings(
+            self.get_variables()["env-dict"], route_throttling, settings_name
+        )
+
+    def get_route_throttle_method_settings(self):
+        route_throttling = self.get_route_throttling(
+            self.get_variables()["env-dict"]["RouteThrottling"]
+        )
+        observability = self.get_variables()["env-dict"].get("Observability")
+        return [
+            apigateway.MethodSetting(
+                ResourcePath="/" + route["Path"].replace("/", "~1"),
+                HttpMethod=route["HttpMethod"],
+                ThrottlingRateLimit=route["RateLimit"],
+                ThrottlingBurstLimit=route["BurstLimit"],
+                MetricsEnabled=bool(observability),
+            )
+            for route in route_throttling.values()
+        ]
+
+    def get_stage_method_settings(self):
+        method_settings = []
+        if self.get_variables()["env-dict"].get("Observability"):
+            method_settings.append(
+                apigateway.MethodSetting(
+                    ResourcePath="/*",
+                    HttpMethod="*",
+                    MetricsEnabled=True,
+                    LoggingLevel="ERROR",
+                )
+            )
+        if self.get_variables()["env-dict"].get("ApiCache"):
+            method_settings += self.get_cache_method_settings()
+        if self.get_variables()["env-dict"].get("RouteThrottling"):
+            method_settings += self.get_route_throttle_method_settings()
+
+        merged_method_settings = {}
+        for method_setting in method_settings:
+            key = (method_setting.ResourcePath, method_setting.HttpMethod)
+            if key in merged_method_settings:
+                merged_method_settings[key].properties.update(
+                    method_setting.properties
+                )
+            else:
+                merged_method_settings[key] = method_setting
+        return list(merged_method_settings.values()) or NoValue
+
+    def get_http_route_settings(self):
+        route_throttling = self.get_variables()["env-dict"].get("RouteThrottling")
+        if not route_throttling:
+            return NoValue
+        route_throttling = self.get_route_throttling(route_throttling)
+        return dict(
+            (
+                "%s %s" % (route["HttpMethod"], route["Path"]),
+                {
+                    "ThrottlingRateLimit": route["RateLimit"],
+                    "ThrottlingBurstLimit": route["BurstLimit"],
+                },
+            )
+            for route in route_throttling.values()
+        )
+
+    def get_usage_plan_method_throttles(self, tier_name, tier):
+        if not tier.get("RouteThrottling"):
+            return NoValue
+        route_throttling = self.get_route_throttling(
+            tier["RouteThrottling"], "UsagePlanTiers %s RouteThrottling" % tier_name
+        )
+        return dict(
+            (
+                "%s/%s" % (route["Path"], route["HttpMethod"]),
+                apigateway.ThrottleSettings(
+                    RateLimit=route["RateLimit"],
+                    BurstLimit=route["BurstLimit"],
+                ),
+            )
+            for route in route_throttling.values()
+        )
+
+    def create_usage_plan_tiers(self, api_stage):
+        usage_plan_tiers = self.get_variables()["env-dict"].get(
+            "UsagePlanTiers", {}
+        )
+        for tier_name, tier in usage_plan_tiers.items():
+            usage_plan = self.template.add_resource(
+                apigateway.UsagePlan(
+                    "%sUsagePlan" % tier_name,
+                    DependsOn=api_stage,
+                    UsagePlanName=tier["UsagePlanName"],
+                    ApiStages=[
+                        apigateway.ApiStage(
+                            ApiId=self.get_api_reference("ApiId"),
+                            Stage="api",
+                            Throttle=self.get_usage_plan_method_throttles(
+                                tier_name, tier
+                            ),
+                        )
+                    ],
+                    Description="Trimana Dashboard %s Usage Plan" % tier_name,
+                    Quota=apigateway.QuotaSettings(
+                        Limit=tier["QuotaLimit"],
+                        Period=tier.get("QuotaPeriod", "MONTH"),
+                    ),
+                    Throttle=apigateway.ThrottleSettings(
+                        BurstLimit=tier["BurstLimit"],
+                        RateLimit=tier["RateLimit"],
+                    ),
+                )
+            )
+
+            api_key = self.template.add_resource(
+                apigateway.ApiKey(
+                    "%sApiKey" % tier_name,
+                    Name=tier["ApiKeyName"],
+                    Enabled=True,
+                )
+            )
+
+            self.template.add_resource(
+                apigateway.UsagePlanKey(
+                    "%sUsagePlanKey" % tier_name,
+                    DependsOn=usage_plan,
+                    KeyId=Ref(api_key),
+                    KeyType="API_KEY",
+                    UsagePlanId=Ref(usage_plan),
+                )
+            )
+
+    def create_access_logging(self):
+        self.access_log_group = None
+        self.api_gateway_account = None
+        observability = self.get_variables()["env-dict"].get("Observability")
+        if not observability:
+            return
+
+        self.access_log_group = self.template.add_resource(
+            logs.LogGroup(
+                "TrimanaDashboardApiAccessLogGroup",
+                LogGroupName=Sub(
+                    "/aws/apigateway/${ApiName}/api/access",
+                    ApiName=self.get_variables()["env-dict"]["ApiName"],
+                ),
+                RetentionInDays=observability.get("AccessLogRetentionInDays", 30),
+            )
+        )
+
+        if self.get_api_flavor() == "REST":
+            api_gateway_cloudwatch_role = self.template.add_resource(
+                iam.Role(
+                    "TrimanaDashboardApiGatewayCloudWatchRole",
+                    AssumeRolePolicyDocument={
+                        "Version": "2012-10-17",
+                        "Statement": [
+                            {
+                                "Effect": "Allow",
+                                "Principal": {"Service": "apigateway.amazonaws.com"},
+                                "Action": "sts:AssumeRole",
+                            }
+                        ],
+                    },
+                    ManagedPolicyArns=[
+                        "arn:aws:iam::aws:policy/service-role/AmazonAPIGatewayPushToCloudWatchLogs"
+                    ],
+                )
+            )
+
+            self.api_gateway_account = self.template.add_resource(
+                apigateway.Account(
+                    "TrimanaDashboardApiGatewayAccount",
+                    CloudWatchRoleArn=GetAtt(api_gateway_cloudwatch_role, "Arn"),
+                )
+            )
+
+    def get_route_metric_dimensions(self, method):
+        if self.get_api_flavor() == "HTTP":
+            api_dimension = cloudwatch.MetricDimension(
+                Name="ApiId", Value=self.get_api_reference("ApiId")
+            )
+        else:
+            api_dimension = cloudwatch.MetricDimension(
+                Name="ApiName", Value=self.get_variables()["env-dict"]["ApiName"]
+            )
+
+        return [
+            api_dimension,
+            cloudwatch.MetricDimension(Name="Stage", Value="api"),
+            cloudwatch.MetricDimension(Name="Resource", Value=method["Path"]),
+            cloudwatch.MetricDimension(Name="Method", Value=method["HttpMethod"]),
+        ]
+
+    def get_observed_routes(self):
+        routes = get_routes(self.get_variables()["env-dict"])
+        method_names = set(
+            method_name for route in routes.values() for method_name in route["Methods"]
+        )
+        observability = self.get_variables()["env-dict"]["Observability"]
+        unknown_methods = set(observability.get("Routes", {})) - method_names
+        if unknown_methods:
+            raise ValueError(
+                "Observability Routes has thresholds for %s, which RouteRegistry "
+                "does not define" % ", ".join(sorted(unknown_methods))
+            )
+        return routes
+
+    def get_route_thresholds(self, method_name):
+        observability = self.get_variables()["env-dict"]["Observability"]
+        return dict(
+            dict(
+                (key, observability.get(key, default))
+                for key, default in DEFAULT_ROUTE_THRESHOLDS.items()
+            ),
+            **observability.get("Routes", {}).get(method_name, {})
+        )
+
+    def create_route_alarms(self):
+        self.server_error_alarms = []
+        observability = self.get_variables()["env-dict"].get("Observability")
+        if not observability:
+            return
+
+        alarm_actions = (
+            [observability["AlarmTopicArn"]]
+            if observability.get("AlarmTopicArn")
+            else NoValue
+        )
+        server_error_metric = "5xx" if self.get_api_flavor() == "HTTP" else "5XXError"
+
+        for route_name, route in self.get_observed_routes().items():
+            for method_name, method in route["Methods"].items():
+                thresholds = self.get_route_thresholds(method_name)
+                for percentile in ("p95", "p99"):
+                    threshold = thresholds["Latency%sMs" % percentile]
+                    self.template.add_resource(
+                        cloudwatch.Alarm(
+                            "%sLatency%sAlarm" % (method_name, percentile.upper()),
+                            AlarmDescription="%s %s latency above %sms"
+                            % (method["Path"], percentile, threshold),
+                            Namespace="AWS/ApiGateway",
+                            MetricName="Latency",
+                            Dimensions=self.get_route_metric_dimensions(method),
+                            ExtendedStatistic=percentile,
+                            Period=300,
+                            EvaluationPeriods=3,
+                            DatapointsToAlarm=2,
+                            Threshold=threshold,
+                            ComparisonOperator="GreaterThanThreshold",
+                            TreatMissingData="notBreaching",
+                            AlarmActions=alarm_actions,
+                        )
+                    )
+
+                server_error_alarm = self.template.add_resource(
+                    cloudwatch.Alarm(
+                        "%sServerErrorAlarm" % method_name,
+                        AlarmDescription="%s returning 5xx responses" % method["Path"],
+                        Namespace="AWS/ApiGateway",
+                        MetricName=server_error_metric,
+                        Dimensions=self.get_route_metric_dimensions(method),
+                        Statistic="Sum",
+                        Period=300,
+                        EvaluationPeriods=1,
+                        Threshold=thresholds["ServerErrorThreshold"],
+                        ComparisonOperator="GreaterThanOrEqualToThreshold",
+                        TreatMissingData="notBreaching",
+                        AlarmActions=alarm_actions,
+                    )
+                )
+                self.server_error_alarms.append(server_error_alarm)
+
+            for metric_name in ("Errors", "Throttles"):
+                self.template.add_resource(
+                    cloudwatch.Alarm(
+                        "%sLambda%sAlarm" % (route_name, metric_name),
+                        AlarmDescription="Lambda %s %s"
+                        % (route["LambdaName"], metric_name.lower()),
+                        Namespace="AWS/Lambda",
+                        MetricName=metric_name,
+                        Dimensions=[
+                            cloudwatch.MetricDimension(
+                                Name="FunctionName", Value=route["LambdaName"]
+                            ),
+                            cloudwatch.MetricDimension(
+                                Name="Resource", Value="%s:live" % route["LambdaName"]
+                            ),
+                        ],
+                        Statistic="Sum",
+                        Period=300,
+                        EvaluationPeriods=1,
+                        Threshold=1,
+                        ComparisonOperator="GreaterThanOrEqualToThreshold",
+                        TreatMissingData="notBreaching",
+                        AlarmActions=alarm_actions,
+                    )
+                )
+
+    def create_dashboard(self):
+        observability = self.get_variables()["env-dict"].get("Observability")
+        if not observability:
+            return
+
+        if self.get_api_flavor() == "HTTP":
+            api_dimension = ["ApiId", self.get_api_reference("ApiId")]
+        else:
+            api_dimension = ["ApiName", self.get_variables()["env-dict"]["ApiName"]]
+
+        widgets = []
+        for route in self.get_observed_routes().values():
+            for method in route["Methods"].values():
+                method_dimensions = api_dimension + [
+                    "Stage",
+                    "api",
+                    "Resource",
+                    method["Path"],
+                    "Method",
+                    method["HttpMethod"],
+                ]
+                widgets.append(
+                    {
+                        "type": "metric",
+                        "width": 12,
+                        "height": 6,
+                        "properties": {
+                            "title": "%s latency" % method["Path"],
+                            "region": "${AWS::Region}",
+                            "metrics": [
+                                ["AWS/ApiGateway", "Latency"]
+                                + method_dimensions
+                                + [{"stat": stat}]
+                                for stat in ("p50", "p95", "p99")
+                            ]
+                            + [
+                                ["AWS/ApiGateway", "IntegrationLatency"]
+                                + method_dimensions
+                                + [{"stat": "p99"}]
+                            ],
+                        },
+                    }
+                )
+            widgets.append(
+                {
+                    "type": "metric",
+                    "width": 12,
+                    "height": 6,
+                    "properties": {
+                        "title": "%s duration and cold starts" % route["LambdaName"],
+                        "region": "${AWS::Region}",
+                        "metrics": [
+                            [
+                                "AWS/Lambda",
+                                "Duration",
+                                "FunctionName",
+                                route["LambdaName"],
+                                {"stat": "p99"},
+                            ],
+                            [
+                                "LambdaInsights",
+                                "init_duration",
+                                "function_name",
+                                route["LambdaName"],
+                                {"stat": "Maximum"},
+                            ],
+                            [
+                                "AWS/Lambda",
+                                "Throttles",
+                                "FunctionName",
+                                route["LambdaName"],
+                                {"stat": "Sum"},
+                            ],
+                        ],
+                    },
+                }
+            )
+
+        self.template.add_resource(
+            cloudwatch.Dashboard(
+                "TrimanaDashboardPerformanceDashboard",
+                DashboardName=observability.get(
+                    "DashboardName", "trimana-dashboard-performance"
+                ),
+                DashboardBody=Sub(json.dumps({"widgets": widgets})),
+            )
+        )
+
+    def get_api_reference(self, name):
+        api_wiring = self.get_variables()["env-dict"].get("ApiWiring", {})
+        if api_wiring.get(name):
+            return api_wiring[name]
+        return "{{resolve:ssm:%s}}" % SSM_API_REFERENCES[name]
+
+    def get_api_flavor(self):
+        return self.get_variables()["env-dict"].get("ApiFlavor", "REST")
+
+    def create_http_api_stage(self):
+        return self.template.add_resource(
+            apigatewayv2.Stage(
+                "TrimanaDashboardHttpApiStage",
+                ApiId=self.get_api_reference("ApiId"),
+                StageName="api",
+                AutoDeploy=True,
+                DefaultRouteSettings=apigatewayv2.RouteSettings(
+                    ThrottlingBurstLimit=100,
+                    ThrottlingRateLimit=50,
+                    DetailedMetricsEnabled=bool(self.access_log_group),
+                ),
+                RouteSettings=self.get_http_route_settings(),
+                AccessLogSettings=(
+                    apigatewayv2.AccessLogSettings(
+                        DestinationArn=GetAtt(self.access_log_group, "Arn"),
+                        Format=ACCESS_LOG_FORMAT,
+                    )
+                    if self.access_log_group
+                    else NoValue
+                ),
+            )
+        )
+
+    def create_api_deployment(self):
+        api_revision = {
+            "ApiRevision": self.get_variables()["env-dict"].get("ApiRevision", ""),
+            "ApiWiring": self.get_variables()["env-dict"].get("ApiWiring", {}),
+        }
+        revision_digest = hashlib.sha256(
+            json.dumps(api_revision, sort_keys=True).encode()
+        ).hexdigest()
+
+        api_deployment = self.template.add_resource(
             apigateway.Deployment(
-                "TrimanaDashboardApiDeployment",
-                RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+                "TrimanaDashboardApiDeployment%s" % revision_digest[:10],
+                RestApiId=self.get_api_reference("ApiId"),
+                Description="API revision %s" % revision_digest[:10],
             )
         )
+        if self.get_variables()["env-dict"].get("Canary"):
+            api_deployment.DeletionPolicy = "Retain"
+        return api_deployment
+
+    def get_canary_setting(self, api_deployment):
+        canary = self.get_variables()["env-dict"].get("Canary")
+        if not canary or not canary.get("BaselineDeploymentId"):
+            return NoValue
+
+        return apigateway.StageCanarySetting(
+            DeploymentId=Ref(api_deployment),
+            PercentTraffic=canary["TrafficPercent"],
+            UseStageCache=False,
+        )
+
+    def get_stage_metric(self, query_id, metric_name, stat, stage):
+        return cloudwatch.MetricDataQuery(
+            Id=query_id,
+            ReturnData=False,
+            MetricStat=cloudwatch.MetricStat(
+                Metric=cloudwatch.Metric(
+                    Namespace="AWS/ApiGateway",
+                    MetricName=metric_name,
+                    Dimensions=[
+                        cloudwatch.MetricDimension(
+                            Name="ApiName",
+                            Value=self.get_variables()["env-dict"]["ApiName"],
+                        ),
+                        cloudwatch.MetricDimension(Name="Stage", Value=stage),
+                    ],
+                ),
+                Period=60,
+                Stat=stat,
+            ),
+        )
+
+    def create_canary_alarms(self):
+        canary = self.get_variables()["env-dict"].get("Canary")
+        if not canary:
+            return
+
+        latency_alarm = self.template.add_resource(
+            cloudwatch.Alarm(
+                "TrimanaDashboardApiCanaryLatencyAlarm",
+                AlarmName=Sub("${AWS::StackName}-api-canary-latency"),
+                AlarmDescription="api/Canary p99 latency is more than %s%% above "
+                "the api stage" % canary["LatencyTolerancePercent"],
+                Metrics=[
+                    self.get_stage_metric("canary", "Latency", "p99", "api/Canary"),
+                    self.get_stage_metric("baseline", "Latency", "p99", "api"),
+                    cloudwatch.MetricDataQuery(
+                        Id="regression",
+                        Expression="canary - baseline * %s"
+                        % (1 + canary["LatencyTolerancePercent"] / 100.0),
+                        ReturnData=True,
+                    ),
+                ],
+                EvaluationPeriods=3,
+                DatapointsToAlarm=2,
+                Threshold=0,
+                ComparisonOperator="GreaterThanThreshold",
+                TreatMissingData="notBreaching",
+            )
+        )
+
+        error_rate_alarm = self.template.add_resource(
+            cloudwatch.Alarm(
+                "TrimanaDashboardApiCanaryErrorRateAlarm",
+                AlarmName=Sub("${AWS::StackName}-api-canary-error-rate"),
+                AlarmDescription="api/Canary 5xx rate is more than %s points above "
+                "the api stage" % canary["ErrorRateTolerancePercent"],
+                Metrics=[
+                    self.get_stage_metric(
+                        "canary", "5XXError", "Average", "api/Canary"
+                    ),
+                    self.get_stage_metric("baseline", "5XXError", "Average", "api"),
+                    cloudwatch.MetricDataQuery(
+                        Id="regression",
+                        Expression="100 * canary - 100 * baseline",
+                        ReturnData=True,
+                    ),
+                ],
+                EvaluationPeriods=3,
+                DatapointsToAlarm=2,
+                Threshold=canary["ErrorRateTolerancePercent"],
+                ComparisonOperator="GreaterThanThreshold",
+                TreatMissingData="notBreaching",
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "ApiCanaryAlarmNames",
+                Value=Join(",", [Ref(latency_alarm), Ref(error_rate_alarm)]),
+            )
+        )
+
+    def create_rest_api_stage(self):
+        api_cache = self.get_variables()["env-dict"].get("ApiCache")
+
+        trimana_dashboard_api_deoployment = self.create_api_deployment()
+        canary_setting = self.get_canary_setting(trimana_dashboard_api_deoployment)
 
         trimana_dashboard_api_stage = self.template.add_resource(
             apigateway.Stage(
                 "TrimanaDashboardApiStage",
-                DeploymentId=Ref(trimana_dashboard_api_deoployment),
-                RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+                DeploymentId=(
+                    Ref(trimana_dashboard_api_deoployment)
+                    if canary_setting is NoValue
+                    else self.get_variables()["env-dict"]["Canary"][
+                        "BaselineDeploymentId"
+                    ]
+                ),
+                CanarySetting=canary_setting,
+                RestApiId=self.get_api_reference("ApiId"),
                 StageName="api",
+                CacheClusterEnabled=bool(api_cache),
+                CacheClusterSize=api_cache["ClusterSize"] if api_cache else NoValue,
+                MethodSettings=self.get_stage_method_settings(),
+                TracingEnabled=bool(self.access_log_group),
+                AccessLogSetting=(
+                    apigateway.AccessLogSetting(
+                        DestinationArn=GetAtt(self.access_log_group, "Arn"),
+                        Format=ACCESS_LOG_FORMAT,
+                    )
+                    if self.access_log_group
+                    else NoValue
+                ),
             )
         )
+        if self.api_gateway_account:
+            trimana_dashboard_api_stage.DependsOn = [self.api_gateway_account.title]
 
         trimana_dashboard_usage_plan = self.template.add_resource(
             apigateway.UsagePlan(
@@ -32,7 +637,7 @@ class Trimana(Blueprint):
                 UsagePlanName=self.get_variables()["env-dict"]["ApiUsagePlanName"],
                 ApiStages=[
                     apigateway.ApiStage(
-                        ApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+                        ApiId=self.get_api_reference("ApiId"),
                         Stage="api",
                     )
                 ],
@@ -65,3 +670,172 @@ class Trimana(Blueprint):
                 UsagePlanId=Ref(trimana_dashboard_usage_plan),
             )
         )
+
+        self.create_usage_plan_tiers(trimana_dashboard_api_stage)
+        self.create_canary_alarms()
+        return trimana_dashboard_api_stage
+
+    def create_regional_domain_name(self, api_stage, certificate):
+        domain_name = self.get_variables()["env-dict"]["CustomDomain"]["DomainName"]
+        if self.get_api_flavor() == "HTTP":
+            regional_domain_name = self.template.add_resource(
+                apigatewayv2.DomainName(
+                    "TrimanaDashboardApiDomainName",
+                    DomainName=domain_name,
+                    DomainNameConfigurations=[
+                        apigatewayv2.DomainNameConfiguration(
+                            CertificateArn=Ref(certificate),
+                            EndpointType="REGIONAL",
+                            SecurityPolicy="TLS_1_2",
+                        )
+                    ],
+                )
+            )
+            self.template.add_resource(
+                apigatewayv2.ApiMapping(
+                    "TrimanaDashboardApiMapping",
+                    DependsOn=api_stage,
+                    ApiId=self.get_api_reference("ApiId"),
+                    DomainName=Ref(regional_domain_name),
+                    Stage="api",
+                )
+            )
+        else:
+            regional_domain_name = self.template.add_resource(
+                apigateway.DomainName(
+                    "TrimanaDashboardApiDomainName",
+                    DomainName=domain_name,
+                    RegionalCertificateArn=Ref(certificate),
+                    EndpointConfiguration=apigateway.EndpointConfiguration(
+                        Types=["REGIONAL"]
+                    ),
+                    SecurityPolicy="TLS_1_2",
+                )
+            )
+            self.template.add_resource(
+                apigateway.BasePathMapping(
+                    "TrimanaDashboardApiBasePathMapping",
+                    DependsOn=api_stage,
+                    DomainName=Ref(regional_domain_name),
+                    RestApiId=self.get_api_reference("ApiId"),
+                    Stage="api",
+                )
+            )
+        return regional_domain_name
+
+    def create_regional_health_check(self):
+        custom_domain = self.get_variables()["env-dict"]["CustomDomain"]
+        health_checks = []
+        if self.get_api_flavor() == "REST":
+            health_checks.append(
+                self.template.add_resource(
+                    route53.HealthCheck(
+                        "TrimanaDashboardApiEndpointHealthCheck",
+                        HealthCheckConfig=route53.HealthCheckConfig(
+                            Type="HTTPS",
+                            FullyQualifiedDomainName=Sub(
+                                "${ApiId}.execute-api.${AWS::Region}.amazonaws.com",
+                                ApiId=self.get_api_reference("ApiId"),
+                            ),
+                            ResourcePath=custom_domain["HealthCheckPath"],
+                            Port=443,
+                            RequestInterval=30,
+                            FailureThreshold=3,
+                        ),
+                        HealthCheckTags=Tags(
+                            Name=Sub("trimana-dashboard-api-endpoint-${AWS::Region}")
+                        ),
+                    )
+                )
+            )
+
+        for server_error_alarm in self.server_error_alarms:
+            health_checks.append(
+                self.template.add_resource(
+                    route53.HealthCheck(
+                        "%sHealthCheck" % server_error_alarm.title,
+                        HealthCheckConfig=route53.HealthCheckConfig(
+                            Type="CLOUDWATCH_METRIC",
+                            AlarmIdentifier=route53.AlarmIdentifier(
+                                Name=Ref(server_error_alarm),
+                                Region=Ref("AWS::Region"),
+                            ),
+                            InsufficientDataHealthStatus="LastKnownStatus",
+                        ),
+                    )
+                )
+            )
+
+        if not health_checks:
+            return None
+        return self.template.add_resource(
+            route53.HealthCheck(
+                "TrimanaDashboardApiRegionHealthCheck",
+                HealthCheckConfig=route53.HealthCheckConfig(
+                    Type="CALCULATED",
+                    ChildHealthChecks=[
+                        Ref(health_check) for health_check in health_checks
+                    ],
+                    HealthThreshold=len(health_checks),
+                ),
+                HealthCheckTags=Tags(Name=Sub("trimana-dashboard-api-${AWS::Region}")),
+            )
+        )
+
+    def create_custom_domain(self, api_stage):
+        custom_domain = self.get_variables()["env-dict"].get("CustomDomain")
+        if not custom_domain:
+            return
+
+        certificate = self.template.add_resource(
+            certificatemanager.Certificate(
+                "TrimanaDashboardApiCertificate",
+                DomainName=custom_domain["DomainName"],
+                ValidationMethod="DNS",
+                DomainValidationOptions=[
+                    certificatemanager.DomainValidationOption(
+                        DomainName=custom_domain["DomainName"],
+                        HostedZoneId=custom_domain["HostedZoneId"],
+                    )
+                ],
+            )
+        )
+        regional_domain_name = self.create_regional_domain_name(api_stage, certificate)
+        region_health_check = self.create_regional_health_check()
+
+        self.template.add_resource(
+            route53.RecordSetType(
+                "TrimanaDashboardApiLatencyRecord",
+                HostedZoneId=custom_domain["HostedZoneId"],
+                Name=custom_domain["DomainName"],
+                Type="A",
+                SetIdentifier=Ref("AWS::Region"),
+                Region=Ref("AWS::Region"),
+                HealthCheckId=(
+                    Ref(region_health_check) if region_health_check else NoValue
+                ),
+                AliasTarget=route53.AliasTarget(
+                    DNSName=GetAtt(regional_domain_name, "RegionalDomainName"),
+                    HostedZoneId=GetAtt(regional_domain_name, "RegionalHostedZoneId"),
+                    EvaluateTargetHealth=True,
+                ),
+            )
+        )
+
+        self.template.add_output(
+            Output(
+                "RegionalDomainName",
+                Value=GetAtt(regional_domain_name, "RegionalDomainName"),
+            )
+        )
+
+    def create_template(self):
+        self.create_access_logging()
+        if self.get_api_flavor() == "HTTP":
+            api_stage = self.create_http_api_stage()
+        else:
+            api_stage = self.create_rest_api_stage()
+        self.create_route_alarms()
+        self.create_custom_domain(api_stage)
+        self.create_dashboard()
+        return self.template
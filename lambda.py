@@ -1,235 +1,2093 @@
+import hashlib
+import json
+
+from api import SSM_API_REFERENCES
+from route_registry import (
+    get_api_resource,
+    get_method_title,
+    get_registry_method_settings,
+    get_routes,
+    get_shard_key,
+    get_shard_limits,
+    get_shard_names,
+    lift_shard_references,
+    render_shard,
+)
 from stacker.blueprints.base import Blueprint
 from troposphere import (
+    Output,
     Ref,
     GetAtt,
     iam,
     awslambda,
     Parameter,
     Sub,
+    Join,
+    NoValue,
+    Template,
     apigateway,
+    apigatewayv2,
+    applicationautoscaling,
+    cloudformation,
+    cloudwatch,
+    codedeploy,
+    dynamodb,
+    firehose,
+    glue,
+    logs,
+    policies,
     scheduler,
+    sns,
+    sqs,
+    stepfunctions,
 )
 
+LOG_PIPELINE_COLUMNS = [
+    ("timestamp", "string"),
+    ("time", "string"),
+    ("type", "string"),
+    ("level", "string"),
+    ("logger", "string"),
+    ("requestid", "string"),
+    ("message", "string"),
+    ("record", "string"),
+]
+
+
+class LogPipelineProcessor(firehose.Processor):
+    props = dict(firehose.Processor.props, Type=(str, True))
+
+
+class CanaryAliasUpdate(policies.CodeDeployLambdaAliasUpdate):
+    props = dict(
+        policies.CodeDeployLambdaAliasUpdate.props,
+        ApplicationName=(str, True),
+        DeploymentGroupName=(str, True),
+    )
+
+
+DEFAULT_PERFORMANCE_PROFILE = {
+    "MemorySize": 128,
+    "Architecture": "x86_64",
+    "EphemeralStorage": 512,
+    "Timeout": 60,
+    "MemoryMatrix": [],
+}
+
+
+def validate_memory_size(name, memory_size):
+    if not isinstance(memory_size, int) or not 128 <= memory_size <= 10240:
+        raise ValueError(
+            "MemorySize for %s must be an integer between 128 and 10240, got %r"
+            % (name, memory_size)
+        )
+    return memory_size
+
+
+def validate_performance_profile(name, profile):
+    unknown_keys = set(profile) - set(DEFAULT_PERFORMANCE_PROFILE)
+    if unknown_keys:
+        raise ValueError(
+            "Unknown PerformanceProfile keys for %s: %s"
+            % (name, ", ".join(sorted(unknown_keys)))
+        )
+
+    profile = dict(DEFAULT_PERFORMANCE_PROFILE, **profile)
+    validate_memory_size(name, profile["MemorySize"])
+    for memory_size in profile["MemoryMatrix"]:
+        validate_memory_size(name, memory_size)
+    if profile["Architecture"] not in ("arm64", "x86_64"):
+        raise ValueError(
+            "Architecture for %s must be arm64 or x86_64, got %r"
+            % (name, profile["Architecture"])
+        )
+    if not 512 <= profile["EphemeralStorage"] <= 10240:
+        raise ValueError(
+            "EphemeralStorage for %s must be between 512 and 10240, got %r"
+            % (name, profile["EphemeralStorage"])
+        )
+    if not 1 <= profile["Timeout"] <= 900:
+        raise ValueError(
+            "Timeout for %s must be between 1 and 900, got %r"
+            % (name, profile["Timeout"])
+        )
+    return profile
+
+
+DEFAULT_SCHEDULE_POLICY = {
+    "FlexibleWindowMinutes": 0,
+    "MaximumRetryAttempts": 185,
+    "MaximumEventAgeInSeconds": 86400,
+    "Locations": {},
+}
+
+
+def validate_schedule_policy(name, policy):
+    unknown_keys = set(policy) - set(DEFAULT_SCHEDULE_POLICY)
+    if unknown_keys:
+        raise ValueError(
+            "Unknown SchedulePolicy keys for %s: %s"
+            % (name, ", ".join(sorted(unknown_keys)))
+        )
+
+    policy = dict(DEFAULT_SCHEDULE_POLICY, **policy)
+    if not 0 <= policy["FlexibleWindowMinutes"] <= 1440:
+        raise ValueError(
+            "FlexibleWindowMinutes for %s must be between 0 and 1440, got %r"
+            % (name, policy["FlexibleWindowMinutes"])
+        )
+    if not 0 <= policy["MaximumRetryAttempts"] <= 185:
+        raise ValueError(
+            "MaximumRetryAttempts for %s must be between 0 and 185, got %r"
+            % (name, policy["MaximumRetryAttempts"])
+        )
+    if not 60 <= policy["MaximumEventAgeInSeconds"] <= 86400:
+        raise ValueError(
+            "MaximumEventAgeInSeconds for %s must be between 60 and 86400, got %r"
+            % (name, policy["MaximumEventAgeInSeconds"])
+        )
+    return policy
+
+
+class Trimana(Blueprint):
+    VARIABLES = {"env-dict": {"type": dict}}
+
+    def create_idempotency_table(self):
+        self.idempotency_table = None
+        idempotency_table = self.get_variables()["env-dict"].get("IdempotencyTable")
+        if not idempotency_table:
+            return
+
+        self.idempotency_table = self.template.add_resource(
+            dynamodb.Table(
+                "TrimanaDashboardIdempotencyTable",
+                TableName=idempotency_table["TableName"],
+                BillingMode="PAY_PER_REQUEST",
+                AttributeDefinitions=[
+                    dynamodb.AttributeDefinition(
+                        AttributeName="IdempotencyKey", AttributeType="S"
+                    )
+                ],
+                KeySchema=[
+                    dynamodb.KeySchema(AttributeName="IdempotencyKey", KeyType="HASH")
+                ],
+                TimeToLiveSpecification=dynamodb.TimeToLiveSpecification(
+                    AttributeName=idempotency_table.get("TtlAttribute", "ExpiresAt"),
+                    Enabled=True,
+                ),
+            )
+        )
+
+    def create_payroll_aggregates_table(self):
+        self.payroll_aggregates_table = None
+        payroll_aggregates = self.get_variables()["env-dict"].get("PayrollAggregates")
+        if not payroll_aggregates:
+            return
+
+        self.payroll_aggregates_table = self.template.add_resource(
+            dynamodb.Table(
+                "PayrollAggregatesTable",
+                TableName=payroll_aggregates["TableName"],
+                BillingMode="PAY_PER_REQUEST",
+                AttributeDefinitions=[
+                    dynamodb.AttributeDefinition(AttributeName="pk", AttributeType="S"),
+                    dynamodb.AttributeDefinition(AttributeName="sk", AttributeType="S"),
+                ],
+                KeySchema=[
+                    dynamodb.KeySchema(AttributeName="pk", KeyType="HASH"),
+                    dynamodb.KeySchema(AttributeName="sk", KeyType="RANGE"),
+                ],
+                StreamSpecification=dynamodb.StreamSpecification(
+                    StreamViewType="NEW_IMAGE"
+                ),
+                TimeToLiveSpecification=dynamodb.TimeToLiveSpecification(
+                    AttributeName=payroll_aggregates.get("TtlAttribute", "ExpiresAt"),
+                    Enabled=True,
+                ),
+            )
+        )
+
+    def get_payroll_aggregates_policies(self, name):
+        if not self.payroll_aggregates_table:
+            return []
+
+        return [
+            iam.Policy(
+                PolicyName="%sLambdaPayrollAggregatesPolicy" % name,
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": [
+                                "dynamodb:GetItem",
+                                "dynamodb:PutItem",
+                                "dynamodb:Query",
+                                "dynamodb:BatchGetItem",
+                            ],
+                            "Resource": [GetAtt(self.payroll_aggregates_table, "Arn")],
+                        }
+                    ],
+                },
+            )
+        ]
+
+    def get_payroll_aggregates_environment(self):
+        if not self.payroll_aggregates_table:
+            return {}
+
+        return {"PAYROLL_AGGREGATES_TABLE": Ref(self.payroll_aggregates_table)}
+
+    def get_existing_trimana_bucket(self):
+        self.existing_trimana_bucket = self.template.add_parameter(
+            Parameter(
+                "TrimanaDashboardS3Bucket",
+                Type="String",
+                Default=self.get_variables()["env-dict"]["BucketName"],
+            )
+        )
+
+    def get_performance_profile(self, name):
+        return validate_performance_profile(
+            name,
+            self.get_variables()["env-dict"]
+            .get("PerformanceProfile", {})
+            .get(name, {}),
+        )
+
+    def get_log_group_arns(self, name, lambda_name):
+        log_group_arns = [
+            Sub(
+                "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:/aws/lambda/${LambdaName}:*",
+                LambdaName=lambda_name,
+            )
+        ]
+        log_pipeline = self.get_variables()["env-dict"].get("LogPipeline")
+        if log_pipeline:
+            log_group_arns.append(
+                Sub(
+                    "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:${LogGroupName}:*",
+                    LogGroupName=self.get_log_group_name(lambda_name),
+                )
+            )
+        if self.get_performance_profile(name)["MemoryMatrix"]:
+            log_group_arns.append(
+                Sub(
+                    "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:/aws/lambda/${LambdaName}-*mb:*",
+                    LambdaName=lambda_name,
+                )
+            )
+        return log_group_arns
+
+    def get_log_policy(self, name, lambda_name):
+        return iam.Policy(
+            PolicyName="%sLambdaLogPolicy" % name,
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Action": "logs:CreateLogGroup",
+                        "Resource": Sub(
+                            "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:*"
+                        ),
+                    },
+                    {
+                        "Effect": "Allow",
+                        "Action": [
+                            "logs:CreateLogStream",
+                            "logs:PutLogEvents",
+                        ],
+                        "Resource": self.get_log_group_arns(name, lambda_name),
+                    },
+                ],
+            },
+        )
+
+    def get_log_group_name(self, lambda_name):
+        log_pipeline = self.get_variables()["env-dict"]["LogPipeline"]
+        return "%s%s" % (
+            log_pipeline.get("LogGroupPrefix", "/trimana/lambda/"),
+            lambda_name,
+        )
+
+    def get_logging_config(self, lambda_name):
+        if not self.get_variables()["env-dict"].get("LogPipeline"):
+            return NoValue
+        return awslambda.LoggingConfig(
+            LogFormat="JSON",
+            LogGroup=self.get_log_group_name(lambda_name),
+        )
+
+    def create_log_pipeline(self):
+        log_pipeline = self.get_variables()["env-dict"].get("LogPipeline")
+        if not log_pipeline:
+            return
+
+        log_database = self.template.add_resource(
+            glue.Database(
+                "LambdaLogDatabase",
+                CatalogId=Ref("AWS::AccountId"),
+                DatabaseInput=glue.DatabaseInput(Name=log_pipeline["GlueDatabaseName"]),
+            )
+        )
+
+        log_location = Sub(
+            "s3://${BucketName}/${Prefix}",
+            BucketName=Ref(self.existing_trimana_bucket),
+            Prefix=log_pipeline["Prefix"],
+        )
+        log_table = self.template.add_resource(
+            glue.Table(
+                "LambdaLogTable",
+                CatalogId=Ref("AWS::AccountId"),
+                DatabaseName=Ref(log_database),
+                TableInput=glue.TableInput(
+                    Name=log_pipeline["GlueTableName"],
+                    TableType="EXTERNAL_TABLE",
+                    Parameters={
+                        "classification": "parquet",
+                        "projection.enabled": "true",
+                        "projection.dt.type": "date",
+                        "projection.dt.format": "yyyy-MM-dd",
+                        "projection.dt.range": "%s,NOW"
+                        % log_pipeline["ProjectionStartDate"],
+                        "projection.dt.interval": "1",
+                        "projection.dt.interval.unit": "DAYS",
+                        "storage.location.template": Join(
+                            "", [log_location, "dt=${dt}/"]
+                        ),
+                    },
+                    PartitionKeys=[glue.Column(Name="dt", Type="string")],
+                    StorageDescriptor=glue.StorageDescriptor(
+                        Columns=[
+                            glue.Column(Name=column_name, Type=column_type)
+                            for column_name, column_type in LOG_PIPELINE_COLUMNS
+                        ],
+                        Location=log_location,
+                        InputFormat="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                        OutputFormat="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                        SerdeInfo=glue.SerdeInfo(
+                            SerializationLibrary="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+                        ),
+                    ),
+                ),
+            )
+        )
+
+        delivery_stream_role = self.template.add_resource(
+            iam.Role(
+                "LambdaLogDeliveryStreamRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "firehose.amazonaws.com"},
+                            "Action": "sts:AssumeRole",
+                        }
+                    ],
+                },
+                Policies=[
+                    iam.Policy(
+                        PolicyName="LambdaLogDeliveryStreamPolicy",
+                        PolicyDocument={
+                            "Version": "2012-10-17",
+                            "Statement": [
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "s3:AbortMultipartUpload",
+                                        "s3:GetBucketLocation",
+                                        "s3:ListBucket",
+                                        "s3:ListBucketMultipartUploads",
+                                    ],
+                                    "Resource": Sub(
+                                        "arn:aws:s3:::${BucketName}",
+                                        BucketName=Ref(self.existing_trimana_bucket),
+                                    ),
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": ["s3:GetObject", "s3:PutObject"],
+                                    "Resource": [
+                                        Sub(
+                                            "arn:aws:s3:::${BucketName}/${Prefix}*",
+                                            BucketName=Ref(
+                                                self.existing_trimana_bucket
+                                            ),
+                                            Prefix=prefix,
+                                        )
+                                        for prefix in (
+                                            log_pipeline["Prefix"],
+                                            log_pipeline["ErrorPrefix"],
+                                        )
+                                    ],
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "glue:GetTable",
+                                        "glue:GetTableVersion",
+                                        "glue:GetTableVersions",
+                                    ],
+                                    "Resource": [
+                                        Sub(
+                                            "arn:aws:glue:${AWS::Region}:${AWS::AccountId}:catalog"
+                                        ),
+                                        Sub(
+                                            "arn:aws:glue:${AWS::Region}:${AWS::AccountId}:database/${Database}",
+                                            Database=Ref(log_database),
+                                        ),
+                                        Sub(
+                                            "arn:aws:glue:${AWS::Region}:${AWS::AccountId}:table/${Database}/${Table}",
+                                            Database=Ref(log_database),
+                                            Table=Ref(log_table),
+                                        ),
+                                    ],
+                                },
+                            ],
+                        },
+                    )
+                ],
+            )
+        )
+
+        self.log_delivery_stream = self.template.add_resource(
+            firehose.DeliveryStream(
+                "LambdaLogDeliveryStream",
+                DeliveryStreamName=log_pipeline["DeliveryStreamName"],
+                DeliveryStreamType="DirectPut",
+                ExtendedS3DestinationConfiguration=firehose.ExtendedS3DestinationConfiguration(
+                    BucketARN=Sub(
+                        "arn:aws:s3:::${BucketName}",
+                        BucketName=Ref(self.existing_trimana_bucket),
+                    ),
+                    RoleARN=GetAtt(delivery_stream_role, "Arn"),
+                    Prefix="%sdt=!{timestamp:yyyy-MM-dd}/" % log_pipeline["Prefix"],
+                    ErrorOutputPrefix="%s!{firehose:error-output-type}/dt=!{timestamp:yyyy-MM-dd}/"
+                    % log_pipeline["ErrorPrefix"],
+                    BufferingHints=firehose.BufferingHints(
+                        IntervalInSeconds=log_pipeline.get(
+                            "BufferingIntervalInSeconds", 300
+                        ),
+                        SizeInMBs=log_pipeline.get("BufferingSizeInMBs", 128),
+                    ),
+                    CompressionFormat="UNCOMPRESSED",
+                    ProcessingConfiguration=firehose.ProcessingConfiguration(
+                        Enabled=True,
+                        Processors=[
+                            LogPipelineProcessor(
+                                Type="Decompression",
+                                Parameters=[
+                                    firehose.ProcessorParameter(
+                                        ParameterName="CompressionFormat",
+                                        ParameterValue="GZIP",
+                                    )
+                                ],
+                            ),
+                            LogPipelineProcessor(
+                                Type="CloudWatchLogProcessing",
+                                Parameters=[
+                                    firehose.ProcessorParameter(
+                                        ParameterName="DataMessageExtraction",
+                                        ParameterValue="true",
+                                    )
+                                ],
+                            ),
+                        ],
+                    ),
+                    DataFormatConversionConfiguration=firehose.DataFormatConversionConfiguration(
+                        Enabled=True,
+                        InputFormatConfiguration=firehose.InputFormatConfiguration(
+                            Deserializer=firehose.Deserializer(
+                                OpenXJsonSerDe=firehose.OpenXJsonSerDe()
+                            )
+                        ),
+                        OutputFormatConfiguration=firehose.OutputFormatConfiguration(
+                            Serializer=firehose.Serializer(
+                                ParquetSerDe=firehose.ParquetSerDe(Compression="SNAPPY")
+                            )
+                        ),
+                        SchemaConfiguration=firehose.SchemaConfiguration(
+                            CatalogId=Ref("AWS::AccountId"),
+                            DatabaseName=Ref(log_database),
+                            TableName=Ref(log_table),
+                            Region=Ref("AWS::Region"),
+                            RoleARN=GetAtt(delivery_stream_role, "Arn"),
+                            VersionId="LATEST",
+                        ),
+                    ),
+                ),
+            )
+        )
+
+        self.log_subscription_role = self.template.add_resource(
+            iam.Role(
+                "LambdaLogSubscriptionRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "logs.amazonaws.com"},
+                            "Action": "sts:AssumeRole",
+                            "Condition": {
+                                "StringLike": {
+                                    "aws:SourceArn": Sub(
+                                        "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:*"
+                                    )
+                                }
+                            },
+                        }
+                    ],
+                },
+                Policies=[
+                    iam.Policy(
+                        PolicyName="LambdaLogSubscriptionPolicy",
+                        PolicyDocument={
+                            "Version": "2012-10-17",
+                            "Statement": [
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "firehose:PutRecord",
+                                        "firehose:PutRecordBatch",
+                                    ],
+                                    "Resource": GetAtt(self.log_delivery_stream, "Arn"),
+                                }
+                            ],
+                        },
+                    )
+                ],
+            )
+        )
+
+    def add_dependency(self, resource, dependency):
+        depends_on = resource.resource.get("DependsOn", [])
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        resource.DependsOn = depends_on + [dependency.title]
+
+    def create_log_group(self, name, lambda_function):
+        log_pipeline = self.get_variables()["env-dict"].get("LogPipeline")
+        if not log_pipeline:
+            return
+
+        log_group = self.template.add_resource(
+            logs.LogGroup(
+                "%sLambdaLogGroup" % name,
+                LogGroupName=self.get_log_group_name(
+                    lambda_function.properties["FunctionName"]
+                ),
+                RetentionInDays=log_pipeline["RetentionInDays"],
+            )
+        )
+        self.add_dependency(lambda_function, log_group)
+
+        self.template.add_resource(
+            logs.SubscriptionFilter(
+                "%sLambdaLogSubscriptionFilter" % name,
+                LogGroupName=Ref(log_group),
+                FilterPattern=log_pipeline.get("FilterPattern", ""),
+                DestinationArn=GetAtt(self.log_delivery_stream, "Arn"),
+                RoleArn=GetAtt(self.log_subscription_role, "Arn"),
+            )
+        )
+
+    def is_schedule_region(self):
+        env_dict = self.get_variables()["env-dict"]
+        schedule_region = env_dict.get("ScheduleRegion")
+        return not schedule_region or schedule_region == env_dict.get("Region")
+
+    def create_schedule_group(self):
+        self.schedule_group = None
+        self.schedule_dead_letter_queue = None
+        schedule_policy = self.get_variables()["env-dict"].get("SchedulePolicy")
+        if not schedule_policy or not self.is_schedule_region():
+            return
+
+        self.schedule_group = self.template.add_resource(
+            scheduler.ScheduleGroup(
+                "TrimanaDashboardScheduleGroup",
+                Name=schedule_policy["GroupName"],
+            )
+        )
+
+        self.schedule_dead_letter_queue = self.template.add_resource(
+            sqs.Queue(
+                "TrimanaDashboardScheduleDeadLetterQueue",
+                QueueName=schedule_policy["DeadLetterQueueName"],
+                MessageRetentionPeriod=1209600,
+            )
+        )
+
+        self.template.add_resource(
+            cloudwatch.Alarm(
+                "TrimanaDashboardScheduleDeadLetterAlarm",
+                AlarmDescription="Scheduled runs exhausted their retries",
+                Namespace="AWS/SQS",
+                MetricName="ApproximateNumberOfMessagesVisible",
+                Dimensions=[
+                    cloudwatch.MetricDimension(
+                        Name="QueueName",
+                        Value=GetAtt(self.schedule_dead_letter_queue, "QueueName"),
+                    )
+                ],
+                Statistic="Maximum",
+                Period=300,
+                EvaluationPeriods=1,
+                Threshold=1,
+                ComparisonOperator="GreaterThanOrEqualToThreshold",
+                TreatMissingData="notBreaching",
+                AlarmActions=(
+                    [schedule_policy["AlarmTopicArn"]]
+                    if schedule_policy.get("AlarmTopicArn")
+                    else NoValue
+                ),
+            )
+        )
+
+    def get_schedule_policy(self, name):
+        schedule_policy = self.get_variables()["env-dict"].get("SchedulePolicy", {})
+        return validate_schedule_policy(
+            name, schedule_policy.get("Schedules", {}).get(name, {})
+        )
+
+    def get_schedules(self, name, schedule_name, schedule_expression):
+        locations = self.get_schedule_policy(name)["Locations"]
+        if not locations:
+            return [("%sScheduler" % name, schedule_name, schedule_expression, None)]
+        return [
+            (
+                "%s%sScheduler" % (name, location_name),
+                "%s-%s" % (schedule_name, location["Location"]),
+                location["ScheduleExpression"],
+                location["Location"],
+            )
+            for location_name, location in locations.items()
+        ]
+
+    def get_schedule_dead_letter_statements(self):
+        if not self.schedule_dead_letter_queue:
+            return []
+        return [
+            {
+                "Effect": "Allow",
+                "Action": ["sqs:SendMessage"],
+                "Resource": GetAtt(self.schedule_dead_letter_queue, "Arn"),
+            }
+        ]
+
+    def get_schedule_target_settings(self, name):
+        schedule_policy = self.get_schedule_policy(name)
+        return {
+            "RetryPolicy": scheduler.RetryPolicy(
+                MaximumEventAgeInSeconds=schedule_policy["MaximumEventAgeInSeconds"],
+                MaximumRetryAttempts=schedule_policy["MaximumRetryAttempts"],
+            ),
+            "DeadLetterConfig": (
+                scheduler.DeadLetterConfig(
+                    Arn=GetAtt(self.schedule_dead_letter_queue, "Arn")
+                )
+                if self.schedule_dead_letter_queue
+                else NoValue
+            ),
+        }
+
+    def get_flexible_time_window(self, name):
+        flexible_window_minutes = self.get_schedule_policy(name)[
+            "FlexibleWindowMinutes"
+        ]
+        if not flexible_window_minutes:
+            return scheduler.FlexibleTimeWindow(Mode="OFF")
+        return scheduler.FlexibleTimeWindow(
+            Mode="FLEXIBLE", MaximumWindowInMinutes=flexible_window_minutes
+        )
+
+    def get_s3_policy(self, name, write_prefix=None):
+        statements = [
+            {
+                "Effect": "Allow",
+                "Action": ["s3:GetObject"],
+                "Resource": [
+                    Sub(
+                        "arn:aws:s3:::${BucketName}/*",
+                        BucketName=self.get_variables()["env-dict"]["BucketName"],
+                    )
+                ],
+            }
+        ]
+        if write_prefix:
+            statements.append(
+                {
+                    "Effect": "Allow",
+                    "Action": ["s3:PutObject"],
+                    "Resource": [
+                        Sub(
+                            "arn:aws:s3:::${BucketName}/%s*" % write_prefix,
+                            BucketName=self.get_variables()["env-dict"]["BucketName"],
+                        )
+                    ],
+                }
+            )
+        return iam.Policy(
+            PolicyName="%sLambdaS3Policy" % name,
+            PolicyDocument={"Version": "2012-10-17", "Statement": statements},
+        )
+
+    def get_sqs_policy(self, name, queue, send=False):
+        return iam.Policy(
+            PolicyName="%sLambdaSqsPolicy" % name,
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Action": [
+                            "sqs:ReceiveMessage",
+                            "sqs:DeleteMessage",
+                            "sqs:GetQueueAttributes",
+                            "sqs:ChangeMessageVisibility",
+                        ]
+                        + (["sqs:SendMessage"] if send else []),
+                        "Resource": [GetAtt(queue, "Arn")],
+                    }
+                ],
+            },
+        )
+
+    def get_secrets_manager_policy(self, name):
+        return iam.Policy(
+            PolicyName="%sLambdaSecretsManagerPolicy" % name,
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Action": ["secretsmanager:GetSecretValue"],
+                        "Resource": [
+                            Sub(
+                                "arn:aws:secretsmanager:${AWS::Region}:${AWS::AccountId}:secret:${SecretId}${SecretSuffix}",
+                                SecretId=self.get_variables()["env-dict"][
+                                    "SharedSecretsId"
+                                ],
+                                SecretSuffix=self.get_variables()["env-dict"][
+                                    "SharedSecretsArnSuffix"
+                                ],
+                            )
+                        ],
+                    }
+                ],
+            },
+        )
+
+    def get_idempotency_policies(self, name):
+        if not self.idempotency_table:
+            return []
+
+        return [
+            iam.Policy(
+                PolicyName="%sLambdaIdempotencyPolicy" % name,
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": [
+                                "dynamodb:GetItem",
+                                "dynamodb:PutItem",
+                                "dynamodb:UpdateItem",
+                                "dynamodb:DeleteItem",
+                            ],
+                            "Resource": [GetAtt(self.idempotency_table, "Arn")],
+                        }
+                    ],
+                },
+            )
+        ]
+
+    def get_idempotency_environment(self):
+        if not self.idempotency_table:
+            return {}
+
+        return {"IDEMPOTENCY_TABLE": Ref(self.idempotency_table)}
+
+    def get_secrets_extension_environment(self):
+        secrets_extension = self.get_variables()["env-dict"].get("SecretsExtension")
+        if not secrets_extension:
+            return {}
+
+        return {
+            "PARAMETERS_SECRETS_EXTENSION_CACHE_ENABLED": "true",
+            "PARAMETERS_SECRETS_EXTENSION_HTTP_PORT": str(
+                secrets_extension.get("Port", 2773)
+            ),
+            "SECRETS_MANAGER_TTL": str(secrets_extension.get("CacheTtl", 300)),
+        }
+
+    def get_observability_managed_policies(self):
+        if not self.get_variables()["env-dict"].get("Observability"):
+            return NoValue
+
+        return [
+            "arn:aws:iam::aws:policy/AWSXRayDaemonWriteAccess",
+            "arn:aws:iam::aws:policy/CloudWatchLambdaInsightsExecutionRolePolicy",
+        ]
+
+    def get_tracing_config(self):
+        if not self.get_variables()["env-dict"].get("Observability"):
+            return NoValue
+
+        return awslambda.TracingConfig(Mode="Active")
+
+    def create_shared_layers(self):
+        self.shared_layers = {}
+        shared_layers = self.get_variables()["env-dict"].get("SharedLayers", {})
+        for name, shared_layer in shared_layers.items():
+            self.shared_layers[name] = self.template.add_resource(
+                awslambda.LayerVersion(
+                    "%sLayerVersion" % name,
+                    LayerName=shared_layer["LayerName"],
+                    Description=shared_layer.get("Description", NoValue),
+                    Content=awslambda.Content(
+                        S3Bucket=Ref(self.existing_trimana_bucket),
+                        S3Key=shared_layer["S3Key"],
+                        S3ObjectVersion=self.get_code_version(
+                            shared_layer["LayerName"]
+                        ),
+                    ),
+                    CompatibleArchitectures=shared_layer.get(
+                        "CompatibleArchitectures", ["x86_64"]
+                    ),
+                    CompatibleRuntimes=shared_layer.get(
+                        "CompatibleRuntimes", ["provided.al2023"]
+                    ),
+                )
+            )
+
+    def get_shared_layers(self, name, profile):
+        shared_layers = self.get_variables()["env-dict"].get("SharedLayers", {})
+        layers = []
+        for layer_name, shared_layer in shared_layers.items():
+            if name not in shared_layer["Functions"]:
+                continue
+            if profile["Architecture"] not in shared_layer.get(
+                "CompatibleArchitectures", ["x86_64"]
+            ):
+                raise ValueError(
+                    "Layer %s is not built for %s, which runs on %s"
+                    % (layer_name, name, profile["Architecture"])
+                )
+            layers.append(Ref(self.shared_layers[layer_name]))
+        return layers
+
+    def get_function_package(self, name, lambda_name, s3_key, profile):
+        container_image = (
+            self.get_variables()["env-dict"].get("ContainerImages", {}).get(name)
+        )
+        if container_image:
+            return {
+                "PackageType": "Image",
+                "Code": awslambda.Code(ImageUri=container_image["ImageUri"]),
+                "ImageConfig": (
+                    awslambda.ImageConfig(Command=container_image["Command"])
+                    if container_image.get("Command")
+                    else NoValue
+                ),
+            }
+        return {
+            "Code": self.get_lambda_code(lambda_name, s3_key),
+            "Handler": "handler",
+            "Runtime": "provided.al2023",
+            "Layers": self.get_layers(name, profile),
+        }
+
+    def get_layers(self, name, profile):
+        layers = self.get_shared_layers(name, profile)
+        observability = self.get_variables()["env-dict"].get("Observability")
+        if observability:
+            layers.append(
+                Sub(
+                    "arn:aws:lambda:${AWS::Region}:${LayerAccountId}:layer:LambdaInsightsExtension${ArchitectureSuffix}:${LayerVersion}",
+                    LayerAccountId=observability.get(
+                        "InsightsLayerAccountId", "580247275435"
+                    ),
+                    ArchitectureSuffix=(
+                        "-Arm64" if profile["Architecture"] == "arm64" else ""
+                    ),
+                    LayerVersion=str(
+                        observability["InsightsLayerVersions"][profile["Architecture"]]
+                    ),
+                )
+            )
+        secrets_extension = self.get_variables()["env-dict"].get("SecretsExtension")
+        if secrets_extension:
+            layers.append(
+                Sub(
+                    "arn:aws:lambda:${AWS::Region}:${LayerAccountId}:layer:AWS-Parameters-and-Secrets-Lambda-Extension${ArchitectureSuffix}:${LayerVersion}",
+                    LayerAccountId=secrets_extension.get(
+                        "LayerAccountId", "345057560386"
+                    ),
+                    ArchitectureSuffix=(
+                        "-Arm64" if profile["Architecture"] == "arm64" else ""
+                    ),
+                    LayerVersion=str(
+                        secrets_extension["LayerVersions"][profile["Architecture"]]
+                    ),
+                )
+            )
+        return layers or NoValue
+
+    def get_report_delivery_environment(self):
+        report_delivery = self.get_variables()["env-dict"].get("ReportDelivery")
+        if not report_delivery:
+            return {}
+
+        delivery_mode = report_delivery.get("Mode", "presigned")
+        if delivery_mode not in ("inline", "presigned"):
+            raise ValueError(
+                "ReportDelivery Mode must be inline or presigned, got %r"
+                % delivery_mode
+            )
+        if delivery_mode == "inline":
+            return {"REPORT_DELIVERY_MODE": delivery_mode}
+
+        return {
+            "REPORT_DELIVERY_MODE": delivery_mode,
+            "REPORT_PRESIGNED_URL_THRESHOLD_BYTES": str(
+                report_delivery.get("PresignedUrlThresholdBytes", 5242880)
+            ),
+            "REPORT_PRESIGNED_URL_TTL_SECONDS": str(
+                report_delivery.get("PresignedUrlTtlSeconds", 900)
+            ),
+        }
+
+    def create_report_streaming_url(self):
+        report_delivery = self.get_variables()["env-dict"].get("ReportDelivery")
+        if not report_delivery or not report_delivery.get("StreamingFunctionUrl"):
+            return
+
+        streaming_auth_type = report_delivery.get("StreamingAuthType", "AWS_IAM")
+        report_streaming_url = self.template.add_resource(
+            awslambda.Url(
+                "TrimanaDashboardReportStreamingUrl",
+                DependsOn=self.trimana_dashboard_lambda_alias,
+                TargetFunctionArn=Ref(self.trimana_dashboard_lambda_function),
+                Qualifier="live",
+                AuthType=streaming_auth_type,
+                InvokeMode="RESPONSE_STREAM",
+            )
+        )
+
+        if streaming_auth_type == "NONE":
+            self.template.add_resource(
+                awslambda.Permission(
+                    "TrimanaDashboardReportStreamingUrlPermission",
+                    DependsOn=self.trimana_dashboard_lambda_alias,
+                    Action="lambda:InvokeFunctionUrl",
+                    FunctionName=Ref(self.trimana_dashboard_lambda_alias),
+                    FunctionUrlAuthType="NONE",
+                    Principal="*",
+                )
+            )
+
+        self.template.add_output(
+            Output(
+                "TrimanaDashboardReportStreamingUrl",
+                Value=GetAtt(report_streaming_url, "FunctionUrl"),
+            )
+        )
+
+    def get_scheduled_idempotency_key(self, prefix):
+        return "%s-<aws.scheduler.scheduled-time>" % prefix
+
+    def create_memory_matrix(self, name, lambda_function):
+        for memory_size in self.get_performance_profile(name)["MemoryMatrix"]:
+            self.template.add_resource(
+                awslambda.Function(
+                    "%sLambdaFunction%sMb" % (name, memory_size),
+                    **dict(
+                        lambda_function.properties,
+                        FunctionName="%s-%smb"
+                        % (lambda_function.properties["FunctionName"], memory_size),
+                        MemorySize=memory_size,
+                    )
+                )
+            )
+
+    def get_cache_key_parameters(self, method_name):
+        env_dict = self.get_variables()["env-dict"]
+        if not env_dict.get("ApiCache"):
+            return []
+        cache_methods = get_registry_method_settings(
+            env_dict, env_dict["ApiCache"]["Methods"], "ApiCache Methods"
+        )
+        if method_name not in cache_methods:
+            return []
+
+        return ["method.request.header.x-api-key"] + [
+            "method.request.querystring.%s" % parameter
+            for parameter in cache_methods[method_name].get("CacheKeyParameters", [])
+        ]
+
+    def get_code_version(self, name):
+        code_versions = self.get_variables()["env-dict"].get("LambdaCodeVersions")
+        return (code_versions or {}).get(name) or NoValue
+
+    def get_lambda_code(self, lambda_name, s3_key):
+        return awslambda.Code(
+            S3Bucket=Ref(self.existing_trimana_bucket),
+            S3Key=s3_key,
+            S3ObjectVersion=self.get_code_version(lambda_name),
+        )
+
+    def get_function_digest(self, lambda_function):
+        function_digest = hashlib.sha256(
+            json.dumps(lambda_function.to_dict(), sort_keys=True).encode()
+        )
+        shared_layers = dict(
+            (shared_layer.title, shared_layer)
+            for shared_layer in self.shared_layers.values()
+        )
+        layers = lambda_function.properties.get("Layers")
+        for layer in layers if isinstance(layers, list) else []:
+            if isinstance(layer, Ref) and layer.data["Ref"] in shared_layers:
+                function_digest.update(
+                    json.dumps(
+                        shared_layers[layer.data["Ref"]].to_dict(), sort_keys=True
+                    ).encode()
+                )
+        return function_digest.hexdigest()
+
+    def create_live_alias(self, name, lambda_function):
+        function_digest = self.get_function_digest(lambda_function)
+        lambda_version = self.template.add_resource(
+            awslambda.Version(
+                "%sLambdaVersion%s" % (name, function_digest[:10]),
+                FunctionName=Ref(lambda_function),
+            )
+        )
+
+        lambda_alias = self.template.add_resource(
+            awslambda.Alias(
+                "%sLambdaLiveAlias" % name,
+                FunctionName=Ref(lambda_function),
+                FunctionVersion=GetAtt(lambda_version, "Version"),
+                Name="live",
+            )
+        )
+        self.create_canary_deployment(
+            name, lambda_function, lambda_version, lambda_alias
+        )
+        return lambda_alias
+
+    def create_canary_application(self):
+        self.canary_application = None
+        if not self.get_variables()["env-dict"].get("Canary"):
+            return
+
+        self.canary_application = self.template.add_resource(
+            codedeploy.Application(
+                "TrimanaDashboardCodeDeployApplication",
+                ComputePlatform="Lambda",
+            )
+        )
+
+        self.canary_deployment_role = self.template.add_resource(
+            iam.Role(
+                "TrimanaDashboardCodeDeployRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "codedeploy.amazonaws.com"},
+                            "Action": "sts:AssumeRole",
+                        }
+                    ],
+                },
+                ManagedPolicyArns=[
+                    "arn:aws:iam::aws:policy/service-role/AWSCodeDeployRoleForLambda"
+                ],
+            )
+        )
+
+    def get_canary_metric(self, query_id, lambda_name, metric_name, stat, version):
+        dimensions = [
+            cloudwatch.MetricDimension(Name="FunctionName", Value=lambda_name),
+            cloudwatch.MetricDimension(Name="Resource", Value="%s:live" % lambda_name),
+        ]
+        if version:
+            dimensions.append(
+                cloudwatch.MetricDimension(Name="ExecutedVersion", Value=version)
+            )
+        return cloudwatch.MetricDataQuery(
+            Id=query_id,
+            ReturnData=False,
+            MetricStat=cloudwatch.MetricStat(
+                Metric=cloudwatch.Metric(
+                    Namespace="AWS/Lambda",
+                    MetricName=metric_name,
+                    Dimensions=dimensions,
+                ),
+                Period=60,
+                Stat=stat,
+            ),
+        )
+
+    def create_canary_deployment(self, name, lambda_function, lambda_version, alias):
+        canary = self.get_variables()["env-dict"].get("Canary")
+        if not canary or name not in canary["Functions"]:
+            return
+
+        lambda_name = lambda_function.properties["FunctionName"]
+        canary_version = GetAtt(lambda_version, "Version")
+
+        latency_alarm = self.template.add_resource(
+            cloudwatch.Alarm(
+                "%sCanaryLatencyAlarm" % name,
+                AlarmName=Sub("${AWS::StackName}-%s-canary-latency" % name),
+                AlarmDescription="%s canary p99 duration is more than %s%% above "
+                "the live alias" % (lambda_name, canary["LatencyTolerancePercent"]),
+                Metrics=[
+                    self.get_canary_metric(
+                        "canary", lambda_name, "Duration", "p99", canary_version
+                    ),
+                    self.get_canary_metric(
+                        "baseline", lambda_name, "Duration", "p99", None
+                    ),
+                    cloudwatch.MetricDataQuery(
+                        Id="regression",
+                        Expression="canary - baseline * %s"
+                        % (1 + canary["LatencyTolerancePercent"] / 100.0),
+                        ReturnData=True,
+                    ),
+                ],
+                EvaluationPeriods=3,
+                DatapointsToAlarm=2,
+                Threshold=0,
+                ComparisonOperator="GreaterThanThreshold",
+                TreatMissingData="notBreaching",
+            )
+        )
+
+        error_rate_alarm = self.template.add_resource(
+            cloudwatch.Alarm(
+                "%sCanaryErrorRateAlarm" % name,
+                AlarmName=Sub("${AWS::StackName}-%s-canary-error-rate" % name),
+                AlarmDescription="%s canary error rate is more than %s points above "
+                "the live alias" % (lambda_name, canary["ErrorRateTolerancePercent"]),
+                Metrics=[
+                    self.get_canary_metric(
+                        "canaryErrors", lambda_name, "Errors", "Sum", canary_version
+                    ),
+                    self.get_canary_metric(
+                        "canaryInvocations",
+                        lambda_name,
+                        "Invocations",
+                        "Sum",
+                        canary_version,
+                    ),
+                    self.get_canary_metric(
+                        "baselineErrors", lambda_name, "Errors", "Sum", None
+                    ),
+                    self.get_canary_metric(
+                        "baselineInvocations", lambda_name, "Invocations", "Sum", None
+                    ),
+                    cloudwatch.MetricDataQuery(
+                        Id="regression",
+                        Expression="100 * canaryErrors / canaryInvocations"
+                        " - 100 * baselineErrors / baselineInvocations",
+                        ReturnData=True,
+                    ),
+                ],
+                EvaluationPeriods=3,
+                DatapointsToAlarm=2,
+                Threshold=canary["ErrorRateTolerancePercent"],
+                ComparisonOperator="GreaterThanThreshold",
+                TreatMissingData="notBreaching",
+            )
+        )
+
+        deployment_group = self.template.add_resource(
+            codedeploy.DeploymentGroup(
+                "%sDeploymentGroup" % name,
+                ApplicationName=Ref(self.canary_application),
+                DeploymentConfigName=canary.get(
+                    "DeploymentConfigName",
+                    "CodeDeployDefault.LambdaCanary10Percent5Minutes",
+                ),
+                DeploymentStyle=codedeploy.DeploymentStyle(
+                    DeploymentType="BLUE_GREEN",
+                    DeploymentOption="WITH_TRAFFIC_CONTROL",
+                ),
+                ServiceRoleArn=GetAtt(self.canary_deployment_role, "Arn"),
+                AlarmConfiguration=codedeploy.AlarmConfiguration(
+                    Enabled=True,
+                    Alarms=[
+                        codedeploy.Alarm(Name=Ref(latency_alarm)),
+                        codedeploy.Alarm(Name=Ref(error_rate_alarm)),
+                    ],
+                ),
+                AutoRollbackConfiguration=codedeploy.AutoRollbackConfiguration(
+                    Enabled=True,
+                    Events=["DEPLOYMENT_FAILURE", "DEPLOYMENT_STOP_ON_ALARM"],
+                ),
+            )
+        )
+
+        alias.DependsOn = [deployment_group.title]
+        alias.UpdatePolicy = policies.UpdatePolicy(
+            CodeDeployLambdaAliasUpdate=CanaryAliasUpdate(
+                ApplicationName=Ref(self.canary_application),
+                DeploymentGroupName=Ref(deployment_group),
+            )
+        )
+
+    def create_route_shards(self):
+        env_dict = self.get_variables()["env-dict"]
+        routes = get_routes(env_dict)
+        stack_template = self.template
+        self.route_shards = []
+        for shard_name in get_shard_names(routes):
+            self.route_shard = shard_name
+            self.template = Template()
+            self.template.set_description("Trimana Dashboard route shard")
+            route_resources = {}
+            try:
+                for name, route in routes.items():
+                    if route["Shard"] == shard_name:
+                        existing = set(self.template.resources)
+                        self.create_route(name, route)
+                        route_resources[name] = set(self.template.resources) - existing
+                shard_template = self.template.to_dict()
+            finally:
+                self.route_shard = None
+                self.template = stack_template
+
+            references = lift_shard_references(shard_template)
+            body = render_shard(
+                shard_template, shard_name, get_shard_limits(env_dict), route_resources
+            )
+            self.route_shards.append((shard_name, body))
+            self.template.add_resource(
+                cloudformation.Stack(
+                    shard_name,
+                    TemplateURL=Sub(
+                        "https://s3.${BucketRegion}.amazonaws.com/${BucketName}/${Key}",
+                        BucketRegion=self.context.config.stacker_bucket_region
+                        or Ref("AWS::Region"),
+                        BucketName=self.context.bucket_name,
+                        Key=get_shard_key(
+                            self.context.get_fqn(self.name), shard_name, body
+                        ),
+                    ),
+                    Parameters=dict(
+                        (name, self.get_shard_parameter(reference))
+                        for name, reference in references.items()
+                    ),
+                )
+            )
+
+    def get_shard_parameter(self, reference):
+        if len(reference) == 2:
+            return GetAtt(*reference)
+        if reference[0] in SSM_API_REFERENCES:
+            return self.get_api_reference(reference[0])
+        return Ref(reference[0])
+
+    def create_api_revision_output(self):
+        api_resources = dict(
+            (title, resource.to_dict())
+            for title, resource in self.template.resources.items()
+            if resource.resource_type.startswith(
+                (
+                    "AWS::ApiGateway::",
+                    "AWS::ApiGatewayV2::",
+                    "AWS::CloudFormation::Stack",
+                )
+            )
+        )
+        self.template.add_output(
+            Output(
+                "ApiRevision",
+                Value=hashlib.sha256(
+                    json.dumps(api_resources, sort_keys=True).encode()
+                ).hexdigest()[:16],
+            )
+        )
+
+    def create_provisioned_concurrency_schedule(self, name, lambda_name, alias):
+        provisioned_concurrency = self.get_variables()["env-dict"].get(
+            "ProvisionedConcurrency", {}
+        )
+        if name not in provisioned_concurrency:
+            return
+
+        warm_pool = provisioned_concurrency[name]
+        self.template.add_resource(
+            applicationautoscaling.ScalableTarget(
+                "%sProvisionedConcurrencyScalableTarget" % name,
+                DependsOn=alias,
+                ServiceNamespace="lambda",
+                ScalableDimension="lambda:function:ProvisionedConcurrency",
+                ResourceId="function:%s:live" % lambda_name,
+                MinCapacity=0,
+                MaxCapacity=warm_pool["Capacity"],
+                ScheduledActions=[
+                    applicationautoscaling.ScheduledAction(
+                        ScheduledActionName="%s-warm-pool-scale-up" % lambda_name,
+                        Schedule=warm_pool["ScaleUp"],
+                        Timezone=warm_pool.get("Timezone", "America/Los_Angeles"),
+                        ScalableTargetAction=applicationautoscaling.ScalableTargetAction(
+                            MinCapacity=warm_pool["Capacity"],
+                            MaxCapacity=warm_pool["Capacity"],
+                        ),
+                    ),
+                    applicationautoscaling.ScheduledAction(
+                        ScheduledActionName="%s-warm-pool-scale-down" % lambda_name,
+                        Schedule=warm_pool["ScaleDown"],
+                        Timezone=warm_pool.get("Timezone", "America/Los_Angeles"),
+                        ScalableTargetAction=applicationautoscaling.ScalableTargetAction(
+                            MinCapacity=0,
+                            MaxCapacity=0,
+                        ),
+                    ),
+                ],
+            )
+        )
+
+    def get_api_reference(self, name):
+        if self.route_shard:
+            return Ref(name)
+        api_wiring = self.get_variables()["env-dict"].get("ApiWiring", {})
+        if api_wiring.get(name):
+            return api_wiring[name]
+        return "{{resolve:ssm:%s}}" % SSM_API_REFERENCES[name]
+
+    def get_api_flavor(self):
+        return self.get_variables()["env-dict"].get("ApiFlavor", "REST")
+
+    def create_http_api_routes(self, name, lambda_alias, methods):
+        http_api_integration = self.template.add_resource(
+            apigatewayv2.Integration(
+                "%sHttpApiIntegration" % name,
+                ApiId=self.get_api_reference("ApiId"),
+                IntegrationType="AWS_PROXY",
+                IntegrationUri=Ref(lambda_alias),
+                PayloadFormatVersion="2.0",
+            )
+        )
+
+        authorizer_type = self.get_variables()["env-dict"]["HttpApiAuthorizer"]["Type"]
+        for method_name, method in methods.items():
+            self.template.add_resource(
+                apigatewayv2.Route(
+                    "%sRoute" % get_method_title(name, method_name),
+                    ApiId=self.get_api_reference("ApiId"),
+                    RouteKey="%s %s" % (method["HttpMethod"], method["Path"]),
+                    Target=Join("/", ["integrations", Ref(http_api_integration)]),
+                    AuthorizationType="JWT" if authorizer_type == "JWT" else "CUSTOM",
+                    AuthorizerId=self.get_api_reference("AuthorizerId"),
+                )
+            )
+
+    def create_rest_api_methods(self, name, lambda_alias, methods):
+        api_resources = {}
+        for method_name, method in methods.items():
+            method_title = get_method_title(name, method_name)
+            api_reference, path_part = get_api_resource(method["Path"])
+            if not path_part:
+                resource_id = self.get_api_reference(api_reference)
+            else:
+                if method["Path"] not in api_resources:
+                    api_resources[method["Path"]] = self.template.add_resource(
+                        apigateway.Resource(
+                            "%sResource" % method_title,
+                            ParentId=self.get_api_reference(api_reference),
+                            RestApiId=self.get_api_reference("ApiId"),
+                            PathPart=path_part,
+                        )
+                    )
+                resource_id = Ref(api_resources[method["Path"]])
+
+            integration = apigateway.Integration(
+                IntegrationHttpMethod="POST",
+                Type="AWS_PROXY",
+                Uri=Sub(
+                    "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31/functions/${LambdaArn}/invocations",
+                    LambdaArn=Ref(lambda_alias),
+                ),
+            )
+            api_method = apigateway.Method(
+                "%sMethod" % method_title,
+                DependsOn=lambda_alias,
+                AuthorizationType="NONE",
+                ApiKeyRequired=True,
+                HttpMethod=method["HttpMethod"],
+                RestApiId=self.get_api_reference("ApiId"),
+                ResourceId=resource_id,
+                Integration=integration,
+            )
+            cache_key_parameters = self.get_cache_key_parameters(method_name)
+            if cache_key_parameters:
+                api_method.RequestParameters = {
+                    parameter: False for parameter in cache_key_parameters
+                }
+                integration.CacheKeyParameters = cache_key_parameters
+            self.template.add_resource(api_method)
+
+    def get_route_policies(self, name, route):
+        policies = [
+            self.get_s3_policy(
+                name, "reports/" if "Reports" in route["Uses"] else None
+            ),
+            self.get_log_policy(name, route["LambdaName"]),
+            self.get_secrets_manager_policy(name),
+        ]
+        if "TwilioAlertTopic" in route["Uses"] and self.twilio_alert_topic:
+            policies.append(
+                iam.Policy(
+                    PolicyName="%sLambdaSnsPolicy" % name,
+                    PolicyDocument={
+                        "Version": "2012-10-17",
+                        "Statement": [
+                            {
+                                "Effect": "Allow",
+                                "Action": ["sns:Publish"],
+                                "Resource": [Ref(self.twilio_alert_topic)],
+                            }
+                        ],
+                    },
+                )
+            )
+        policies += self.get_idempotency_policies(name)
+        if "PayrollAggregates" in route["Uses"]:
+            policies += self.get_payroll_aggregates_policies(name)
+        return policies
+
+    def get_route_environment(self, route):
+        environment = dict(
+            {"SHARED_SECRETS": self.get_variables()["env-dict"]["SharedSecretsId"]},
+            **self.get_idempotency_environment(),
+            **self.get_secrets_extension_environment(),
+        )
+        if "Reports" in route["Uses"]:
+            environment.update(
+                REPORT_BUCKET=Ref(self.existing_trimana_bucket),
+                REPORT_PREFIX="reports/payroll/",
+                **self.get_report_delivery_environment(),
+            )
+        if "PayrollAggregates" in route["Uses"]:
+            environment.update(self.get_payroll_aggregates_environment())
+        if "TwilioAlertTopic" in route["Uses"] and self.twilio_alert_topic:
+            environment["TWILIO_ALERT_TOPIC_ARN"] = Ref(self.twilio_alert_topic)
+        environment.update(route["Environment"])
+        return environment
+
+    def create_route(self, name, route):
+        lambda_name = route["LambdaName"]
+        lambda_role = self.template.add_resource(
+            iam.Role(
+                "%sLambdaExecutionRole" % name,
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {
+                                "Service": [
+                                    "lambda.amazonaws.com",
+                                    "apigateway.amazonaws.com",
+                                ]
+                            },
+                            "Action": ["sts:AssumeRole"],
+                        }
+                    ],
+                },
+                ManagedPolicyArns=self.get_observability_managed_policies(),
+                Policies=self.get_route_policies(name, route),
+            )
+        )
+
+        route_profile = self.get_performance_profile(name)
+        lambda_function = self.template.add_resource(
+            awslambda.Function(
+                "%sLambdaFunction" % name,
+                FunctionName=lambda_name,
+                **self.get_function_package(
+                    name,
+                    lambda_name,
+                    route["S3Key"]
+                    or Sub("lambdas/${LambdaName}.zip", LambdaName=lambda_name),
+                    route_profile,
+                ),
+                Environment=awslambda.Environment(
+                    Variables=self.get_route_environment(route)
+                ),
+                MemorySize=route_profile["MemorySize"],
+                Architectures=[route_profile["Architecture"]],
+                TracingConfig=self.get_tracing_config(),
+                LoggingConfig=self.get_logging_config(lambda_name),
+                EphemeralStorage=awslambda.EphemeralStorage(
+                    Size=route_profile["EphemeralStorage"]
+                ),
+                Timeout=route_profile["Timeout"],
+                Role=GetAtt(lambda_role, "Arn"),
+            )
+        )
+        self.create_log_group(name, lambda_function)
+        self.create_memory_matrix(name, lambda_function)
+
+        lambda_alias = self.create_live_alias(name, lambda_function)
+        self.create_provisioned_concurrency_schedule(name, lambda_name, lambda_alias)
+
+        if self.get_api_flavor() == "HTTP":
+            self.create_http_api_routes(name, lambda_alias, route["Methods"])
+        else:
+            self.create_rest_api_methods(name, lambda_alias, route["Methods"])
+
+        for method_name, method in route["Methods"].items():
+            self.template.add_resource(
+                awslambda.Permission(
+                    "%sLambdaInvokePermission" % method_name,
+                    DependsOn=lambda_alias,
+                    Action="lambda:InvokeFunction",
+                    FunctionName=Ref(lambda_alias),
+                    Principal="apigateway.amazonaws.com",
+                    SourceArn=Sub(
+                        "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${ApiId}/*/%s%s"
+                        % (method["HttpMethod"], method["Path"]),
+                        ApiId=self.get_api_reference("ApiId"),
+                    ),
+                )
+            )
+        return lambda_function, lambda_alias
+
+    def create_routes(self):
+        self.route_shard = None
+        stack_routes = {}
+        for name, route in get_routes(self.get_variables()["env-dict"]).items():
+            if not route["Shard"]:
+                stack_routes[name] = self.create_route(name, route)
+
+        (
+            self.trimana_dashboard_lambda_function,
+            self.trimana_dashboard_lambda_alias,
+        ) = stack_routes["TrimanaDashboard"]
+        _, self.twilio_alert_lambda_alias = stack_routes["TwilioAlert"]
+
+    def create_payroll_aggregator(self):
+        payroll_aggregates = self.get_variables()["env-dict"].get("PayrollAggregates")
+        if not payroll_aggregates:
+            return
+
+        aggregator_profile = self.get_performance_profile("PayrollAggregator")
+
+        dead_letter_queue = self.template.add_resource(
+            sqs.Queue(
+                "PayrollAggregatorDeadLetterQueue",
+                QueueName="%s-dlq" % payroll_aggregates["AggregatorLambdaName"],
+                MessageRetentionPeriod=1209600,
+            )
+        )
+
+        lambda_role = self.template.add_resource(
+            iam.Role(
+                "PayrollAggregatorLambdaExecutionRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": ["lambda.amazonaws.com"]},
+                            "Action": ["sts:AssumeRole"],
+                        }
+                    ],
+                },
+                ManagedPolicyArns=self.get_observability_managed_policies(),
+                Policies=[
+                    iam.Policy(
+                        PolicyName="PayrollAggregatorLambdaDynamoDbPolicy",
+                        PolicyDocument={
+                            "Version": "2012-10-17",
+                            "Statement": [
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "dynamodb:DescribeStream",
+                                        "dynamodb:GetRecords",
+                                        "dynamodb:GetShardIterator",
+                                        "dynamodb:ListStreams",
+                                    ],
+                                    "Resource": [
+                                        GetAtt(
+                                            self.payroll_aggregates_table, "StreamArn"
+                                        )
+                                    ],
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": ["dynamodb:UpdateItem"],
+                                    "Resource": [
+                                        GetAtt(self.payroll_aggregates_table, "Arn")
+                                    ],
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": ["sqs:SendMessage"],
+                                    "Resource": [GetAtt(dead_letter_queue, "Arn")],
+                                },
+                            ],
+                        },
+                    ),
+                    self.get_log_policy(
+                        "PayrollAggregator", payroll_aggregates["AggregatorLambdaName"]
+                    ),
+                ],
+            )
+        )
+
+        payroll_aggregator_lambda_function = self.template.add_resource(
+            awslambda.Function(
+                "PayrollAggregatorLambdaFunction",
+                FunctionName=payroll_aggregates["AggregatorLambdaName"],
+                **self.get_function_package(
+                    "PayrollAggregator",
+                    payroll_aggregates["AggregatorLambdaName"],
+                    Sub(
+                        "lambdas/${LambdaName}.zip",
+                        LambdaName=payroll_aggregates["AggregatorLambdaName"],
+                    ),
+                    aggregator_profile,
+                ),
+                Environment=awslambda.Environment(
+                    Variables={
+                        "PAYROLL_AGGREGATES_TABLE": Ref(self.payroll_aggregates_table)
+                    }
+                ),
+                MemorySize=aggregator_profile["MemorySize"],
+                Architectures=[aggregator_profile["Architecture"]],
+                TracingConfig=self.get_tracing_config(),
+                LoggingConfig=self.get_logging_config(
+                    payroll_aggregates["AggregatorLambdaName"]
+                ),
+                EphemeralStorage=awslambda.EphemeralStorage(
+                    Size=aggregator_profile["EphemeralStorage"]
+                ),
+                Timeout=aggregator_profile["Timeout"],
+                Role=GetAtt(lambda_role, "Arn"),
+            )
+        )
+        self.create_log_group("PayrollAggregator", payroll_aggregator_lambda_function)
+
+        payroll_aggregator_lambda_alias = self.create_live_alias(
+            "PayrollAggregator", payroll_aggregator_lambda_function
+        )
+
+        self.template.add_resource(
+            awslambda.EventSourceMapping(
+                "PayrollAggregatorEventSourceMapping",
+                EventSourceArn=GetAtt(self.payroll_aggregates_table, "StreamArn"),
+                FunctionName=Ref(payroll_aggregator_lambda_alias),
+                StartingPosition="LATEST",
+                BatchSize=payroll_aggregates.get("BatchSize", 100),
+                MaximumBatchingWindowInSeconds=payroll_aggregates.get(
+                    "MaximumBatchingWindowInSeconds", 0
+                ),
+                ParallelizationFactor=payroll_aggregates.get(
+                    "ParallelizationFactor", 1
+                ),
+                MaximumRetryAttempts=payroll_aggregates.get("MaximumRetryAttempts", 5),
+                BisectBatchOnFunctionError=True,
+                FunctionResponseTypes=["ReportBatchItemFailures"],
+                DestinationConfig=awslambda.DestinationConfig(
+                    OnFailure=awslambda.OnFailure(
+                        Destination=GetAtt(dead_letter_queue, "Arn")
+                    )
+                ),
+                FilterCriteria=awslambda.FilterCriteria(
+                    Filters=[
+                        awslambda.Filter(
+                            Pattern=json.dumps(
+                                {
+                                    "eventName": ["INSERT"],
+                                    "dynamodb": {
+                                        "NewImage": {"RecordType": {"S": ["EVENT"]}}
+                                    },
+                                }
+                            )
+                        )
+                    ]
+                ),
+            )
+        )
+
+    def create_payroll_report_queue(self):
+        self.payroll_report_queue = None
+        report_queue = self.get_variables()["env-dict"].get("PayrollReportQueue")
+        if not report_queue:
+            return
+
+        worker_profile = self.get_performance_profile("PayrollReportWorker")
+
+        dead_letter_queue = self.template.add_resource(
+            sqs.Queue(
+                "PayrollReportDeadLetterQueue",
+                QueueName="%s-dlq" % report_queue["QueueName"],
+                MessageRetentionPeriod=1209600,
+            )
+        )
+
+        self.payroll_report_queue = self.template.add_resource(
+            sqs.Queue(
+                "PayrollReportQueue",
+                QueueName=report_queue["QueueName"],
+                VisibilityTimeout=6 * worker_profile["Timeout"],
+                RedrivePolicy=sqs.RedrivePolicy(
+                    deadLetterTargetArn=GetAtt(dead_letter_queue, "Arn"),
+                    maxReceiveCount=report_queue.get("MaxReceiveCount", 3),
+                ),
+            )
+        )
+
+        lambda_role = self.template.add_resource(
+            iam.Role(
+                "PayrollReportWorkerLambdaExecutionRole",
+                AssumeRolePolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": ["lambda.amazonaws.com"]},
+                            "Action": ["sts:AssumeRole"],
+                        }
+                    ],
+                },
+                ManagedPolicyArns=self.get_observability_managed_policies(),
+                Policies=[
+                    self.get_s3_policy("PayrollReportWorker", "reports/"),
+                    self.get_sqs_policy(
+                        "PayrollReportWorker", self.payroll_report_queue, send=True
+                    ),
+                    self.get_log_policy(
+                        "PayrollReportWorker", report_queue["WorkerLambdaName"]
+                    ),
+                    self.get_secrets_manager_policy("PayrollReportWorker"),
+                ]
+                + self.get_idempotency_policies("PayrollReportWorker"),
+            )
+        )
+
+        self.payroll_report_worker_lambda_function = awslambda.Function(
+            "PayrollReportWorkerLambdaFunction",
+            FunctionName=report_queue["WorkerLambdaName"],
+            **self.get_function_package(
+                "PayrollReportWorker",
+                report_queue["WorkerLambdaName"],
+                Sub(
+                    "lambdas/${LambdaName}.zip",
+                    LambdaName=report_queue["WorkerLambdaName"],
+                ),
+                worker_profile,
+            ),
+            Environment=awslambda.Environment(
+                Variables=dict(
+                    {
+                        "SHARED_SECRETS": self.get_variables()["env-dict"][
+                            "SharedSecretsId"
+                        ],
+                        "PAYROLL_REPORT_QUEUE_URL": Ref(self.payroll_report_queue),
+                        "REPORT_BUCKET": Ref(self.existing_trimana_bucket),
+                        "REPORT_PREFIX": "reports/payroll/",
+                    },
+                    **self.get_idempotency_environment(),
+                    **self.get_secrets_extension_environment(),
+                )
+            ),
+            MemorySize=worker_profile["MemorySize"],
+            Architectures=[worker_profile["Architecture"]],
+            TracingConfig=self.get_tracing_config(),
+            LoggingConfig=self.get_logging_config(report_queue["WorkerLambdaName"]),
+            EphemeralStorage=awslambda.EphemeralStorage(
+                Size=worker_profile["EphemeralStorage"]
+            ),
+            Timeout=worker_profile["Timeout"],
+            Role=GetAtt(lambda_role, "Arn"),
+        )
+        self.template.add_resource(self.payroll_report_worker_lambda_function)
+        self.create_log_group(
+            "PayrollReportWorker", self.payroll_report_worker_lambda_function
+        )
 
-class Trimana(Blueprint):
-    VARIABLES = {"env-dict": {"type": dict}}
+        self.payroll_report_worker_lambda_alias = self.create_live_alias(
+            "PayrollReportWorker", self.payroll_report_worker_lambda_function
+        )
 
-    def get_existing_trimana_bucket(self):
-        self.existing_trimana_bucket = self.template.add_parameter(
-            Parameter(
-                "TrimanaDashboardS3Bucket",
-                Type="String",
-                Default=self.get_variables()["env-dict"]["BucketName"],
+        self.template.add_resource(
+            awslambda.EventSourceMapping(
+                "PayrollReportWorkerEventSourceMapping",
+                EventSourceArn=GetAtt(self.payroll_report_queue, "Arn"),
+                FunctionName=Ref(self.payroll_report_worker_lambda_alias),
+                BatchSize=report_queue.get("BatchSize", 10),
+                MaximumBatchingWindowInSeconds=report_queue.get(
+                    "MaximumBatchingWindowInSeconds", 0
+                ),
+                ScalingConfig=awslambda.ScalingConfig(
+                    MaximumConcurrency=report_queue.get("MaximumConcurrency", 10)
+                ),
+                FunctionResponseTypes=["ReportBatchItemFailures"],
             )
         )
 
-    def create_trimana_dashboard_lambda(self):
-        lambda_role = self.template.add_resource(
+    def get_payroll_report_task(self, payload):
+        return {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": dict(
+                {"FunctionName": "${PayrollReportFunctionArn}"}, **payload
+            ),
+            "Retry": [
+                {
+                    "ErrorEquals": [
+                        "Lambda.ServiceException",
+                        "Lambda.TooManyRequestsException",
+                        "Lambda.SdkClientException",
+                    ],
+                    "IntervalSeconds": 2,
+                    "MaxAttempts": 3,
+                    "BackoffRate": 2,
+                    "JitterStrategy": "FULL",
+                }
+            ],
+        }
+
+    def create_payroll_report_state_machine(self):
+        self.payroll_report_state_machine = None
+        state_machine = self.get_variables()["env-dict"].get(
+            "PayrollReportStateMachine"
+        )
+        if not state_machine:
+            return
+
+        shard_prefix = state_machine.get("ShardPrefix", "reports/tmp/payroll-shards/")
+
+        plan_shards = self.get_payroll_report_task(
+            {
+                "Payload": {
+                    "report": "payroll",
+                    "step": "plan",
+                    "execution_id.$": "$$.Execution.Name",
+                    "input.$": "$",
+                    "shard_prefix": shard_prefix,
+                }
+            }
+        )
+        plan_shards["ResultSelector"] = {
+            "bucket.$": "$.Payload.bucket",
+            "manifest_key.$": "$.Payload.manifest_key",
+        }
+        plan_shards["ResultPath"] = "$.plan"
+        plan_shards["Next"] = "GenerateShards"
+
+        generate_shard = self.get_payroll_report_task({"Payload.$": "$"})
+        generate_shard["OutputPath"] = "$.Payload"
+        generate_shard["End"] = True
+
+        merge_shards = self.get_payroll_report_task(
+            {
+                "Payload": {
+                    "report": "payroll",
+                    "step": "reduce",
+                    "execution_id.$": "$$.Execution.Name",
+                    "input.$": "$",
+                }
+            }
+        )
+        merge_shards["End"] = True
+
+        definition = {
+            "Comment": "Generate the payroll report in parallel shards",
+            "StartAt": "PlanShards",
+            "States": {
+                "PlanShards": plan_shards,
+                "GenerateShards": {
+                    "Type": "Map",
+                    "MaxConcurrency": state_machine.get("MaxConcurrency", 10),
+                    "ToleratedFailurePercentage": state_machine.get(
+                        "ToleratedFailurePercentage", 0
+                    ),
+                    "ItemReader": {
+                        "Resource": "arn:aws:states:::s3:getObject",
+                        "ReaderConfig": {"InputType": "JSON"},
+                        "Parameters": {
+                            "Bucket.$": "$.plan.bucket",
+                            "Key.$": "$.plan.manifest_key",
+                        },
+                    },
+                    "ItemSelector": {
+                        "report": "payroll",
+                        "step": "shard",
+                        "execution_id.$": "$$.Execution.Name",
+                        "shard.$": "$$.Map.Item.Value",
+                    },
+                    "ItemProcessor": {
+                        "ProcessorConfig": {
+                            "Mode": "DISTRIBUTED",
+                            "ExecutionType": "EXPRESS",
+                        },
+                        "StartAt": "GenerateShard",
+                        "States": {"GenerateShard": generate_shard},
+                    },
+                    "ResultWriter": {
+                        "Resource": "arn:aws:states:::s3:putObject",
+                        "Parameters": {
+                            "Bucket": "${BucketName}",
+                            "Prefix": shard_prefix + "results",
+                        },
+                    },
+                    "ResultPath": "$.shards",
+                    "Next": "MergeShards",
+                },
+                "MergeShards": merge_shards,
+            },
+        }
+
+        state_machine_arn = Sub(
+            "arn:aws:states:${AWS::Region}:${AWS::AccountId}:stateMachine:${Name}",
+            Name=state_machine["StateMachineName"],
+        )
+        state_machine_role = self.template.add_resource(
             iam.Role(
-                "TrimanaDashboardLambdaExecutionRole",
+                "PayrollReportStateMachineRole",
                 AssumeRolePolicyDocument={
                     "Version": "2012-10-17",
                     "Statement": [
                         {
                             "Effect": "Allow",
-                            "Principal": {
-                                "Service": [
-                                    "lambda.amazonaws.com",
-                                    "apigateway.amazonaws.com",
-                                ]
-                            },
-                            "Action": ["sts:AssumeRole"],
+                            "Principal": {"Service": "states.amazonaws.com"},
+                            "Action": "sts:AssumeRole",
                         }
                     ],
                 },
                 Policies=[
                     iam.Policy(
-                        PolicyName="TrimanaDashboardLambdaS3Policy",
+                        PolicyName="PayrollReportStateMachinePolicy",
                         PolicyDocument={
                             "Version": "2012-10-17",
                             "Statement": [
                                 {
                                     "Effect": "Allow",
-                                    "Action": ["s3:GetObject"],
-                                    "Resource": [
-                                        Sub(
-                                            "arn:aws:s3:::${BucketName}/*",
-                                            BucketName=self.get_variables()["env-dict"][
-                                                "BucketName"
-                                            ],
-                                        )
-                                    ],
-                                }
-                            ],
-                        },
-                    ),
-                    iam.Policy(
-                        PolicyName="TrimanaDashboardLambdaLogPolicy",
-                        PolicyDocument={
-                            "Version": "2012-10-17",
-                            "Statement": [
+                                    "Action": ["lambda:InvokeFunction"],
+                                    "Resource": Ref(
+                                        self.trimana_dashboard_lambda_alias
+                                    ),
+                                },
                                 {
                                     "Effect": "Allow",
-                                    "Action": "logs:CreateLogGroup",
+                                    "Action": ["s3:GetObject", "s3:PutObject"],
                                     "Resource": Sub(
-                                        "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:*"
+                                        "arn:aws:s3:::${BucketName}/${Prefix}*",
+                                        BucketName=Ref(self.existing_trimana_bucket),
+                                        Prefix=shard_prefix,
                                     ),
                                 },
                                 {
                                     "Effect": "Allow",
                                     "Action": [
-                                        "logs:CreateLogStream",
-                                        "logs:PutLogEvents",
+                                        "s3:ListBucket",
+                                        "s3:ListMultipartUploadParts",
+                                        "s3:AbortMultipartUpload",
                                     ],
                                     "Resource": [
                                         Sub(
-                                            "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:/aws/lambda/${LambdaName}:*",
-                                            LambdaName=self.get_variables()["env-dict"][
-                                                "TrimanaDashboardLambdaName"
-                                            ],
-                                        )
+                                            "arn:aws:s3:::${BucketName}",
+                                            BucketName=Ref(
+                                                self.existing_trimana_bucket
+                                            ),
+                                        ),
+                                        Sub(
+                                            "arn:aws:s3:::${BucketName}/${Prefix}*",
+                                            BucketName=Ref(
+                                                self.existing_trimana_bucket
+                                            ),
+                                            Prefix=shard_prefix,
+                                        ),
                                     ],
                                 },
-                            ],
-                        },
-                    ),
-                    iam.Policy(
-                        PolicyName="TrimanaDashboardLambdaSecretsManagerPolicy",
-                        PolicyDocument={
-                            "Version": "2012-10-17",
-                            "Statement": [
                                 {
                                     "Effect": "Allow",
-                                    "Action": ["secretsmanager:GetSecretValue"],
-                                    "Resource": [
-                                        Sub(
-                                            "arn:aws:secretsmanager:${AWS::Region}:${AWS::AccountId}:secret:${SecretId}-yuRaM1",
-                                            SecretId=self.get_variables()["env-dict"][
-                                                "SharedSecretsId"
-                                            ],
-                                        )
+                                    "Action": ["states:StartExecution"],
+                                    "Resource": state_machine_arn,
+                                },
+                                {
+                                    "Effect": "Allow",
+                                    "Action": [
+                                        "states:DescribeExecution",
+                                        "states:StopExecution",
                                     ],
-                                }
+                                    "Resource": Sub(
+                                        "arn:aws:states:${AWS::Region}:${AWS::AccountId}:execution:${Name}/*",
+                                        Name=state_machine["StateMachineName"],
+                                    ),
+                                },
                             ],
                         },
-                    ),
-                ],
-            )
-        )
-
-        self.trimana_dashboard_lambda_function = awslambda.Function(
-            "TrimanaDashboardLambdaFunction",
-            FunctionName=self.get_variables()["env-dict"]["TrimanaDashboardLambdaName"],
-            Code=awslambda.Code(
-                S3Bucket=Ref(self.existing_trimana_bucket),
-                S3Key=Sub(
-                    "lambdas/${LambdaName}.zip",
-                    LambdaName=self.get_variables()["env-dict"][
-                        "TrimanaDashboardLambdaName"
-                    ],
-                ),
-            ),
-            Environment=awslambda.Environment(
-                Variables={
-                    "SHARED_SECRETS": self.get_variables()["env-dict"][
-                        "SharedSecretsId"
+                    )
+                ]
+                + (
+                    [
+                        iam.Policy(
+                            PolicyName="PayrollReportStateMachineTracingPolicy",
+                            PolicyDocument={
+                                "Version": "2012-10-17",
+                                "Statement": [
+                                    {
+                                        "Effect": "Allow",
+                                        "Action": [
+                                            "xray:PutTraceSegments",
+                                            "xray:PutTelemetryRecords",
+                                            "xray:GetSamplingRules",
+                                            "xray:GetSamplingTargets",
+                                        ],
+                                        "Resource": "*",
+                                    }
+                                ],
+                            },
+                        )
                     ]
-                }
-            ),
-            Handler="handler",
-            Runtime="provided.al2023",
-            Timeout=60,
-            Role=GetAtt(lambda_role, "Arn"),
-        )
-        self.template.add_resource(self.trimana_dashboard_lambda_function)
-
-        payroll_event_api_resource = apigateway.Resource(
-            "TrimanaDashboardPayrollEventResource",
-            ParentId="{{resolve:ssm:/trimana/dashboard/payroll/resource/id}}",
-            RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
-            PathPart="event",
-        )
-        self.template.add_resource(payroll_event_api_resource)
-
-        payroll_report_api_resource = apigateway.Resource(
-            "TrimanaDashboardPayrollReportResource",
-            ParentId="{{resolve:ssm:/trimana/dashboard/payroll/resource/id}}",
-            RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
-            PathPart="report",
-        )
-        self.template.add_resource(payroll_report_api_resource)
-
-        payroll_event_api_method = apigateway.Method(
-            "TrimanaDashboardPayrollEventMethod",
-            DependsOn=self.trimana_dashboard_lambda_function,
-            AuthorizationType="NONE",
-            ApiKeyRequired=True,
-            HttpMethod="POST",
-            RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
-            ResourceId=Ref(payroll_event_api_resource),
-            Integration=apigateway.Integration(
-                IntegrationHttpMethod="POST",
-                Type="AWS_PROXY",
-                Uri=Sub(
-                    "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31/functions/${LambdaArn}/invocations",
-                    LambdaArn=GetAtt(self.trimana_dashboard_lambda_function, "Arn"),
-                ),
-            ),
-        )
-        self.template.add_resource(payroll_event_api_method)
-
-        payroll_report_api_method = apigateway.Method(
-            "TrimanaDashboardPayrollReportMethod",
-            DependsOn=self.trimana_dashboard_lambda_function,
-            AuthorizationType="NONE",
-            ApiKeyRequired=True,
-            HttpMethod="POST",
-            RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
-            ResourceId=Ref(payroll_report_api_resource),
-            Integration=apigateway.Integration(
-                IntegrationHttpMethod="POST",
-                Type="AWS_PROXY",
-                Uri=Sub(
-                    "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31/functions/${LambdaArn}/invocations",
-                    LambdaArn=GetAtt(self.trimana_dashboard_lambda_function, "Arn"),
-                ),
-            ),
-        )
-        self.template.add_resource(payroll_report_api_method)
-
-        self.template.add_resource(
-            awslambda.Permission(
-                "PayrollEventLambdaInvokePermission",
-                DependsOn=self.trimana_dashboard_lambda_function,
-                Action="lambda:InvokeFunction",
-                FunctionName=self.get_variables()["env-dict"][
-                    "TrimanaDashboardLambdaName"
-                ],
-                Principal="apigateway.amazonaws.com",
-                SourceArn=Sub(
-                    "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${ApiId}/*/POST/payroll/event",
-                    ApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+                    if self.get_variables()["env-dict"].get("Observability")
+                    else []
                 ),
             )
         )
 
-        self.template.add_resource(
-            awslambda.Permission(
-                "PayrollReportLambdaInvokePermission",
-                DependsOn=self.trimana_dashboard_lambda_function,
-                Action="lambda:InvokeFunction",
-                FunctionName=self.get_variables()["env-dict"][
-                    "TrimanaDashboardLambdaName"
-                ],
-                Principal="apigateway.amazonaws.com",
-                SourceArn=Sub(
-                    "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${ApiId}/*/POST/payroll/report",
-                    ApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+        self.payroll_report_state_machine = self.template.add_resource(
+            stepfunctions.StateMachine(
+                "PayrollReportStateMachine",
+                StateMachineName=state_machine["StateMachineName"],
+                StateMachineType="STANDARD",
+                Definition=definition,
+                DefinitionSubstitutions={
+                    "PayrollReportFunctionArn": Ref(
+                        self.trimana_dashboard_lambda_alias
+                    ),
+                    "BucketName": Ref(self.existing_trimana_bucket),
+                },
+                RoleArn=GetAtt(state_machine_role, "Arn"),
+                TracingConfiguration=(
+                    stepfunctions.TracingConfiguration(Enabled=True)
+                    if self.get_variables()["env-dict"].get("Observability")
+                    else NoValue
                 ),
             )
         )
 
     def create_payroll_report_scheduler(self):
+        if not self.is_schedule_region():
+            return
+
         scheduler_execution_role = self.template.add_resource(
             iam.Role(
                 "PayrollReportSchedulerExecutionRole",
@@ -254,182 +2112,252 @@ class Trimana(Blueprint):
                                     "Action": ["lambda:InvokeFunction"],
                                     "Resource": "*",
                                 },
-                            ],
+                            ]
+                            + self.get_schedule_dead_letter_statements()
+                            + (
+                                [
+                                    {
+                                        "Effect": "Allow",
+                                        "Action": ["sqs:SendMessage"],
+                                        "Resource": GetAtt(
+                                            self.payroll_report_queue, "Arn"
+                                        ),
+                                    }
+                                ]
+                                if self.payroll_report_queue
+                                else []
+                            )
+                            + (
+                                [
+                                    {
+                                        "Effect": "Allow",
+                                        "Action": ["states:StartExecution"],
+                                        "Resource": Ref(
+                                            self.payroll_report_state_machine
+                                        ),
+                                    }
+                                ]
+                                if self.payroll_report_state_machine
+                                else []
+                            ),
                         },
                     )
                 ],
             )
         )
 
-        payroll_report_sync_scheduler = scheduler.Schedule(
-            "PayrollReportScheduler",
-            Name="payroll-report-scheduler",
-            Description="Payroll Report Scheduler",
-            ScheduleExpression="cron(0 17 ? * * *)",
-            ScheduleExpressionTimezone="America/Los_Angeles",
-            FlexibleTimeWindow=scheduler.FlexibleTimeWindow(Mode="OFF"),
-            Target=scheduler.Target(
-                Arn=GetAtt(self.trimana_dashboard_lambda_function, "Arn"),
-                Input='{"httpMethod": "POST", "path": "/payroll/report"}',
-                RetryPolicy=scheduler.RetryPolicy(
-                    MaximumEventAgeInSeconds=86400, MaximumRetryAttempts=185
+        for logical_id, schedule_name, schedule_expression, location in (
+            self.get_schedules(
+                "PayrollReport", "payroll-report-scheduler", "cron(0 17 ? * * *)"
+            )
+        ):
+            idempotency_prefix = (
+                "payroll-report-%s" % location if location else "payroll-report"
+            )
+            if self.payroll_report_state_machine or self.payroll_report_queue:
+                payroll_report_target_arn = (
+                    Ref(self.payroll_report_state_machine)
+                    if self.payroll_report_state_machine
+                    else GetAtt(self.payroll_report_queue, "Arn")
+                )
+                payroll_report_input = {"report": "payroll", "trigger": "scheduled"}
+                if location:
+                    payroll_report_input["location"] = location
+                if self.idempotency_table:
+                    payroll_report_input[
+                        "idempotency_key"
+                    ] = self.get_scheduled_idempotency_key(idempotency_prefix)
+            else:
+                payroll_report_target_arn = Ref(self.trimana_dashboard_lambda_alias)
+                payroll_report_input = {
+                    "httpMethod": "POST",
+                    "path": "/payroll/report",
+                }
+                if location:
+                    payroll_report_input["body"] = json.dumps({"location": location})
+                if self.idempotency_table:
+                    payroll_report_input["headers"] = {
+                        "Idempotency-Key": self.get_scheduled_idempotency_key(
+                            idempotency_prefix
+                        )
+                    }
+
+            payroll_report_sync_scheduler = scheduler.Schedule(
+                logical_id,
+                Name=schedule_name,
+                GroupName=(
+                    Ref(self.schedule_group) if self.schedule_group else NoValue
                 ),
-                RoleArn=GetAtt(scheduler_execution_role, "Arn"),
-            ),
-        )
-        self.template.add_resource(payroll_report_sync_scheduler)
+                Description="Payroll Report Scheduler",
+                ScheduleExpression=schedule_expression,
+                ScheduleExpressionTimezone="America/Los_Angeles",
+                FlexibleTimeWindow=self.get_flexible_time_window("PayrollReport"),
+                Target=scheduler.Target(
+                    Arn=payroll_report_target_arn,
+                    Input=json.dumps(payroll_report_input),
+                    RoleArn=GetAtt(scheduler_execution_role, "Arn"),
+                    **self.get_schedule_target_settings("PayrollReport")
+                ),
+            )
+            self.template.add_resource(payroll_report_sync_scheduler)
     
-    def create_twilio_alert_lambda(self):
+    def create_twilio_alert_fan_out(self):
+        self.twilio_alert_topic = None
+        fan_out = self.get_variables()["env-dict"].get("TwilioAlertFanOut")
+        if not fan_out:
+            return
+
+        sender_profile = self.get_performance_profile("TwilioAlertSender")
+
+        self.twilio_alert_topic = self.template.add_resource(
+            sns.Topic(
+                "TwilioAlertTopic",
+                TopicName=fan_out["TopicName"],
+            )
+        )
+
+        dead_letter_queue = self.template.add_resource(
+            sqs.Queue(
+                "TwilioAlertRecipientDeadLetterQueue",
+                QueueName="%s-dlq" % fan_out["QueueName"],
+                MessageRetentionPeriod=1209600,
+            )
+        )
+
+        recipient_queue = self.template.add_resource(
+            sqs.Queue(
+                "TwilioAlertRecipientQueue",
+                QueueName=fan_out["QueueName"],
+                VisibilityTimeout=6 * sender_profile["Timeout"],
+                RedrivePolicy=sqs.RedrivePolicy(
+                    deadLetterTargetArn=GetAtt(dead_letter_queue, "Arn"),
+                    maxReceiveCount=fan_out.get("MaxReceiveCount", 3),
+                ),
+            )
+        )
+
+        self.template.add_resource(
+            sqs.QueuePolicy(
+                "TwilioAlertRecipientQueuePolicy",
+                Queues=[Ref(recipient_queue)],
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "sns.amazonaws.com"},
+                            "Action": "sqs:SendMessage",
+                            "Resource": GetAtt(recipient_queue, "Arn"),
+                            "Condition": {
+                                "ArnEquals": {
+                                    "aws:SourceArn": Ref(self.twilio_alert_topic)
+                                }
+                            },
+                        }
+                    ],
+                },
+            )
+        )
+
+        self.template.add_resource(
+            sns.SubscriptionResource(
+                "TwilioAlertRecipientSubscription",
+                TopicArn=Ref(self.twilio_alert_topic),
+                Protocol="sqs",
+                Endpoint=GetAtt(recipient_queue, "Arn"),
+                RawMessageDelivery=True,
+            )
+        )
+
         lambda_role = self.template.add_resource(
             iam.Role(
-                "TwilioAlertLambdaExecutionRole",
+                "TwilioAlertSenderLambdaExecutionRole",
                 AssumeRolePolicyDocument={
                     "Version": "2012-10-17",
                     "Statement": [
                         {
                             "Effect": "Allow",
-                            "Principal": {
-                                "Service": [
-                                    "lambda.amazonaws.com",
-                                    "apigateway.amazonaws.com",
-                                ]
-                            },
+                            "Principal": {"Service": ["lambda.amazonaws.com"]},
                             "Action": ["sts:AssumeRole"],
                         }
                     ],
                 },
+                ManagedPolicyArns=self.get_observability_managed_policies(),
                 Policies=[
-                    iam.Policy(
-                        PolicyName="TwilioAlertLambdaS3Policy",
-                        PolicyDocument={
-                            "Version": "2012-10-17",
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": ["s3:GetObject"],
-                                    "Resource": [
-                                        Sub(
-                                            "arn:aws:s3:::${BucketName}/*",
-                                            BucketName=self.get_variables()["env-dict"][
-                                                "BucketName"
-                                            ],
-                                        )
-                                    ],
-                                }
-                            ],
-                        },
-                    ),
-                    iam.Policy(
-                        PolicyName="TwilioAlertLambdaLogPolicy",
-                        PolicyDocument={
-                            "Version": "2012-10-17",
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": "logs:CreateLogGroup",
-                                    "Resource": Sub(
-                                        "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:*"
-                                    ),
-                                },
-                                {
-                                    "Effect": "Allow",
-                                    "Action": [
-                                        "logs:CreateLogStream",
-                                        "logs:PutLogEvents",
-                                    ],
-                                    "Resource": [
-                                        Sub(
-                                            "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:/aws/lambda/${LambdaName}:*",
-                                            LambdaName=self.get_variables()["env-dict"][
-                                                "TwilioAlertLambdaName"
-                                            ],
-                                        )
-                                    ],
-                                },
-                            ],
-                        },
-                    ),
-                    iam.Policy(
-                        PolicyName="TwilioAlertLambdaSecretsManagerPolicy",
-                        PolicyDocument={
-                            "Version": "2012-10-17",
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": ["secretsmanager:GetSecretValue"],
-                                    "Resource": [
-                                        Sub(
-                                            "arn:aws:secretsmanager:${AWS::Region}:${AWS::AccountId}:secret:${SecretId}-yuRaM1",
-                                            SecretId=self.get_variables()["env-dict"][
-                                                "SharedSecretsId"
-                                            ],
-                                        )
-                                    ],
-                                }
-                            ],
-                        },
+                    self.get_s3_policy("TwilioAlertSender"),
+                    self.get_sqs_policy("TwilioAlertSender", recipient_queue),
+                    self.get_log_policy(
+                        "TwilioAlertSender", fan_out["SenderLambdaName"]
                     ),
+                    self.get_secrets_manager_policy("TwilioAlertSender"),
                 ],
             )
         )
 
-        self.twilio_alert_lambda_function = awslambda.Function(
-            "TwilioAlertLambdaFunction",
-            FunctionName=self.get_variables()["env-dict"]["TwilioAlertLambdaName"],
-            Code=awslambda.Code(
-                S3Bucket=Ref(self.existing_trimana_bucket),
-                S3Key="lambdas/twilio-alert.zip"
-            ),
-            Environment=awslambda.Environment(
-                Variables={
-                    "SHARED_SECRETS": self.get_variables()["env-dict"][
-                        "SharedSecretsId"
-                    ]
-                }
-            ),
-            Handler="handler",
-            Runtime="provided.al2023",
-            Timeout=60,
-            Role=GetAtt(lambda_role, "Arn"),
-        )
-        self.template.add_resource(self.twilio_alert_lambda_function)
-
-        twilio_alert_api_method = apigateway.Method(
-            "TwilioAlertMethod",
-            DependsOn=self.twilio_alert_lambda_function,
-            AuthorizationType="NONE",
-            ApiKeyRequired=True,
-            HttpMethod="POST",
-            RestApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
-            ResourceId="{{resolve:ssm:/trimana/dashboard/alert/resource/id}}",
-            Integration=apigateway.Integration(
-                IntegrationHttpMethod="POST",
-                Type="AWS_PROXY",
-                Uri=Sub(
-                    "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31/functions/${LambdaArn}/invocations",
-                    LambdaArn=GetAtt(self.twilio_alert_lambda_function, "Arn"),
+        reserved_concurrency = fan_out.get("ReservedConcurrency", 5)
+        twilio_alert_sender_lambda_function = self.template.add_resource(
+            awslambda.Function(
+                "TwilioAlertSenderLambdaFunction",
+                FunctionName=fan_out["SenderLambdaName"],
+                **self.get_function_package(
+                    "TwilioAlertSender",
+                    fan_out["SenderLambdaName"],
+                    Sub(
+                        "lambdas/${LambdaName}.zip",
+                        LambdaName=fan_out["SenderLambdaName"],
+                    ),
+                    sender_profile,
                 ),
-            ),
+                Environment=awslambda.Environment(
+                    Variables=dict(
+                        {
+                            "SHARED_SECRETS": self.get_variables()["env-dict"][
+                                "SharedSecretsId"
+                            ]
+                        },
+                        **self.get_secrets_extension_environment(),
+                    )
+                ),
+                MemorySize=sender_profile["MemorySize"],
+                Architectures=[sender_profile["Architecture"]],
+                TracingConfig=self.get_tracing_config(),
+                LoggingConfig=self.get_logging_config(fan_out["SenderLambdaName"]),
+                EphemeralStorage=awslambda.EphemeralStorage(
+                    Size=sender_profile["EphemeralStorage"]
+                ),
+                Timeout=sender_profile["Timeout"],
+                ReservedConcurrentExecutions=reserved_concurrency,
+                Role=GetAtt(lambda_role, "Arn"),
+            )
         )
-        self.template.add_resource(twilio_alert_api_method)
+
+        self.create_log_group("TwilioAlertSender", twilio_alert_sender_lambda_function)
 
         self.template.add_resource(
-            awslambda.Permission(
-                "TwilioAlertLambdaInvokePermission",
-                DependsOn=self.twilio_alert_lambda_function,
-                Action="lambda:InvokeFunction",
-                FunctionName=self.get_variables()["env-dict"][
-                    "TwilioAlertLambdaName"
-                ],
-                Principal="apigateway.amazonaws.com",
-                SourceArn=Sub(
-                    "arn:aws:execute-api:${AWS::Region}:${AWS::AccountId}:${ApiId}/*/POST/alert",
-                    ApiId="{{resolve:ssm:/trimana/dashboard/api/id}}",
+            awslambda.EventSourceMapping(
+                "TwilioAlertSenderEventSourceMapping",
+                EventSourceArn=GetAtt(recipient_queue, "Arn"),
+                FunctionName=Ref(twilio_alert_sender_lambda_function),
+                BatchSize=fan_out.get("BatchSize", 1),
+                ScalingConfig=(
+                    awslambda.ScalingConfig(MaximumConcurrency=reserved_concurrency)
+                    if reserved_concurrency >= 2
+                    else NoValue
                 ),
+                FunctionResponseTypes=["ReportBatchItemFailures"],
             )
         )
 
     def create_twilio_alert_scheduler(self):
+        if not self.is_schedule_region():
+            return
+
+        if self.get_schedule_policy("TwilioAlert")["Locations"]:
+            raise ValueError(
+                "SchedulePolicy for TwilioAlert cannot have Locations: the alert "
+                "body has no location, so every location would send the same SMS"
+            )
+
         scheduler_execution_role = self.template.add_resource(
             iam.Role(
                 "TwilioAlertSchedulerExecutionRole",
@@ -454,35 +2382,66 @@ class Trimana(Blueprint):
                                     "Action": ["lambda:InvokeFunction"],
                                     "Resource": "*",
                                 },
-                            ],
+                            ]
+                            + self.get_schedule_dead_letter_statements(),
                         },
                     )
                 ],
             )
         )
 
+        twilio_alert = self.get_variables()["env-dict"]["TwilioAlert"]
+        twilio_alert_body = json.dumps(
+            {
+                "announcement": twilio_alert["Announcement"],
+                "from_number": twilio_alert["FromNumber"],
+                "to_numbers": twilio_alert["ToNumbers"],
+            }
+        )
+
+        twilio_alert_input = {
+            "httpMethod": "POST",
+            "path": "/alert",
+            "body": twilio_alert_body,
+        }
+        if self.idempotency_table:
+            twilio_alert_input["headers"] = {
+                "Idempotency-Key": self.get_scheduled_idempotency_key("twilio-alert")
+            }
+
         twilio_alert_scheduler = scheduler.Schedule(
             "TwilioAlertScheduler",
             Name="twilio-alert-scheduler",
+            GroupName=Ref(self.schedule_group) if self.schedule_group else NoValue,
             Description="Schedule Twilio Alert",
             ScheduleExpression="cron(0 19 ? * * *)",
             ScheduleExpressionTimezone="America/Los_Angeles",
-            FlexibleTimeWindow=scheduler.FlexibleTimeWindow(Mode="OFF"),
+            FlexibleTimeWindow=self.get_flexible_time_window("TwilioAlert"),
             Target=scheduler.Target(
-                Arn=GetAtt(self.twilio_alert_lambda_function, "Arn"),
-                Input='{"httpMethod": "POST", "path": "/alert", "body": "{\\"announcement\\": \\"Please double check clock in and clock out timesheets for thata and papu.\\", \\"from_number\\": \\"+17755876906\\", \\"to_numbers\\": [\\"+18186895373\\", \\"+18189156894\\", \\"+18188099978\\"]}"}',
-                RetryPolicy=scheduler.RetryPolicy(
-                    MaximumEventAgeInSeconds=86400, MaximumRetryAttempts=185
-                ),
+                Arn=Ref(self.twilio_alert_lambda_alias),
+                Input=json.dumps(twilio_alert_input),
                 RoleArn=GetAtt(scheduler_execution_role, "Arn"),
+                **self.get_schedule_target_settings("TwilioAlert")
             ),
         )
         self.template.add_resource(twilio_alert_scheduler)
 
     def create_template(self):
         self.get_existing_trimana_bucket()
-        self.create_trimana_dashboard_lambda()
+        self.create_idempotency_table()
+        self.create_payroll_aggregates_table()
+        self.create_log_pipeline()
+        self.create_schedule_group()
+        self.create_shared_layers()
+        self.create_canary_application()
+        self.create_twilio_alert_fan_out()
+        self.create_routes()
+        self.create_payroll_aggregator()
+        self.create_report_streaming_url()
+        self.create_payroll_report_queue()
+        self.create_payroll_report_state_machine()
         self.create_payroll_report_scheduler()
-        self.create_twilio_alert_lambda()
         self.create_twilio_alert_scheduler()
+        self.create_route_shards()
+        self.create_api_revision_output()
         return self.template
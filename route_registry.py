@@ -0,0 +1,325 @@
+import hashlib
+import json
+import logging
+
+from botocore.exceptions import ClientError
+from stacker.session_cache import get_session
+from stacker.variables import Variable
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = "route-shards"
+
+DEFAULT_SHARD_LIMITS = {
+    "ShardMaxResources": 400,
+    "ShardMaxBytes": 800000,
+}
+
+DEFAULT_ROUTE = {
+    "S3Key": None,
+    "Uses": [],
+    "Environment": {},
+    "Shard": None,
+}
+
+DEFAULT_METHOD = {
+    "HttpMethod": "POST",
+}
+
+REQUIRED_ROUTE_KEYS = ("LambdaName", "Methods")
+
+ROUTE_USES = ("Reports", "PayrollAggregates", "TwilioAlertTopic")
+
+# The rest of the lambdas stack invokes these routes' live aliases, so they
+# always exist and stay in the lambdas stack.
+STACK_ROUTES = ("TrimanaDashboard", "TwilioAlert")
+
+API_RESOURCES = {
+    "/": "RootResourceId",
+    "/payroll": "PayrollResourceId",
+    "/alert": "AlertResourceId",
+}
+
+
+def get_api_resource(path):
+    if path in API_RESOURCES:
+        return API_RESOURCES[path], None
+    parent_path, _, path_part = path.rpartition("/")
+    if (parent_path or "/") not in API_RESOURCES or not path_part:
+        raise ValueError(
+            "Path must be %s or one level below them, got %r"
+            % (", ".join(sorted(API_RESOURCES)), path)
+        )
+    return API_RESOURCES[parent_path or "/"], path_part
+
+
+def get_method_title(name, method_name):
+    if method_name == name:
+        return name
+    return "%s%s" % (name, method_name)
+
+
+def validate_route(name, route):
+    missing_keys = [key for key in REQUIRED_ROUTE_KEYS if key not in route]
+    if missing_keys:
+        raise ValueError("Route %s is missing %s" % (name, ", ".join(missing_keys)))
+    unknown_keys = set(route) - set(DEFAULT_ROUTE) - set(REQUIRED_ROUTE_KEYS)
+    if unknown_keys:
+        raise ValueError(
+            "Unknown keys for route %s: %s" % (name, ", ".join(sorted(unknown_keys)))
+        )
+
+    route = dict(DEFAULT_ROUTE, **route)
+    unknown_uses = set(route["Uses"]) - set(ROUTE_USES)
+    if unknown_uses:
+        raise ValueError(
+            "Uses for route %s must be among %s, got %s"
+            % (name, ", ".join(ROUTE_USES), ", ".join(sorted(unknown_uses)))
+        )
+    if route["Shard"] and not str(route["Shard"]).isalnum():
+        raise ValueError(
+            "Shard for route %s must be an alphanumeric stack name, got %r"
+            % (name, route["Shard"])
+        )
+    if route["Shard"] and name in STACK_ROUTES:
+        raise ValueError(
+            "Route %s cannot have a Shard, since the lambdas stack invokes it" % name
+        )
+    if not route["Methods"]:
+        raise ValueError("Route %s has no Methods" % name)
+
+    methods = {}
+    for method_name, method in route["Methods"].items():
+        if "Path" not in method or set(method) - {"Path", "HttpMethod"}:
+            raise ValueError(
+                "Method %s of route %s must have a Path and optionally an "
+                "HttpMethod" % (method_name, name)
+            )
+        try:
+            get_api_resource(method["Path"])
+        except ValueError as e:
+            raise ValueError("Method %s of route %s: %s" % (method_name, name, e))
+        methods[method_name] = dict(DEFAULT_METHOD, **method)
+    return dict(route, Methods=methods)
+
+
+def get_routes(env_dict):
+    route_registry = env_dict.get("RouteRegistry") or {}
+    routes = dict(
+        (name, validate_route(name, route))
+        for name, route in (route_registry.get("Routes") or {}).items()
+    )
+    missing_routes = [name for name in STACK_ROUTES if name not in routes]
+    if missing_routes:
+        raise ValueError("RouteRegistry is missing %s" % ", ".join(missing_routes))
+
+    method_routes = {}
+    route_keys = {}
+    path_routes = {}
+    for name, route in routes.items():
+        for method_name, method in route["Methods"].items():
+            if method_routes.setdefault(method_name, name) != name:
+                raise ValueError(
+                    "Method %s is defined by routes %s and %s"
+                    % (method_name, method_routes[method_name], name)
+                )
+            route_key = "%s %s" % (method["HttpMethod"], method["Path"])
+            if route_keys.setdefault(route_key, method_name) != method_name:
+                raise ValueError(
+                    "Methods %s and %s are both %s"
+                    % (route_keys[route_key], method_name, route_key)
+                )
+            if not get_api_resource(method["Path"])[1]:
+                continue
+            if path_routes.setdefault(method["Path"], name) != name:
+                raise ValueError(
+                    "Path %s is used by routes %s and %s; keep the methods of a "
+                    "new path in one route"
+                    % (method["Path"], path_routes[method["Path"]], name)
+                )
+    return routes
+
+
+def get_registry_method_settings(env_dict, settings, settings_name):
+    # Settings keyed by RouteRegistry method name, each merged with the Path
+    # and HttpMethod of its method.
+    methods = dict(
+        (method_name, method)
+        for route in get_routes(env_dict).values()
+        for method_name, method in route["Methods"].items()
+    )
+    unknown_methods = set(settings) - set(methods)
+    if unknown_methods:
+        raise ValueError(
+            "%s has settings for %s, which RouteRegistry does not define"
+            % (settings_name, ", ".join(sorted(unknown_methods)))
+        )
+    for method_name, method_settings in settings.items():
+        if set(method_settings) & set(["Path", "HttpMethod"]):
+            raise ValueError(
+                "%s %s takes its Path and HttpMethod from RouteRegistry"
+                % (settings_name, method_name)
+            )
+    return dict(
+        (method_name, dict(method_settings, **methods[method_name]))
+        for method_name, method_settings in settings.items()
+    )
+
+
+def get_route_artifacts(env_dict):
+    route_registry = env_dict.get("RouteRegistry") or {}
+    return dict(
+        (
+            route["LambdaName"],
+            route.get("S3Key") or "lambdas/%s.zip" % route["LambdaName"],
+        )
+        for route in (route_registry.get("Routes") or {}).values()
+    )
+
+
+def get_shard_limits(env_dict):
+    route_registry = env_dict.get("RouteRegistry") or {}
+    return dict(
+        (key, route_registry.get(key, default))
+        for key, default in DEFAULT_SHARD_LIMITS.items()
+    )
+
+
+def get_shard_names(routes):
+    return sorted(set(route["Shard"] for route in routes.values() if route["Shard"]))
+
+
+def lift_shard_references(template):
+    # Turns the references to the lambdas stack left in a shard template into
+    # shard parameters: Ref X becomes parameter X and GetAtt X.Attr parameter
+    # XAttr. Returns what the lambdas stack passes for each parameter.
+    resources = template["Resources"]
+    references = {}
+
+    def lift(value):
+        if isinstance(value, list):
+            return [lift(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if list(value) == ["Ref"]:
+            if value["Ref"] not in resources and not value["Ref"].startswith("AWS::"):
+                references[value["Ref"]] = [value["Ref"]]
+            return value
+        if list(value) == ["Fn::GetAtt"] and value["Fn::GetAtt"][0] not in resources:
+            name = "".join(value["Fn::GetAtt"])
+            references[name] = value["Fn::GetAtt"]
+            return {"Ref": name}
+        return dict((key, lift(item)) for key, item in value.items())
+
+    template["Resources"] = lift(resources)
+    template["Parameters"] = dict((name, {"Type": "String"}) for name in references)
+    return references
+
+
+def get_shard_overflow(resources, body_size, route_resources, limits):
+    # Takes routes off the end of an oversized shard, newest first, until
+    # what is left fits, so the error names the routes to pin elsewhere.
+    def get_size(names):
+        return len(json.dumps(dict((name, resources[name]) for name in names)).encode())
+
+    resource_count = len(resources)
+    overflow = []
+    for route_name in reversed(list(route_resources)):
+        if (
+            resource_count <= limits["ShardMaxResources"]
+            and body_size <= limits["ShardMaxBytes"]
+        ):
+            break
+        names = route_resources[route_name]
+        overflow.insert(0, (route_name, len(names), get_size(names)))
+        resource_count -= len(names)
+        body_size -= get_size(names)
+    return overflow
+
+
+def render_shard(template, shard_name, limits, route_resources):
+    body = json.dumps(template, sort_keys=True)
+    if (
+        len(template["Resources"]) <= limits["ShardMaxResources"]
+        and len(body.encode()) <= limits["ShardMaxBytes"]
+    ):
+        return body
+
+    overflow = get_shard_overflow(
+        template["Resources"], len(body.encode()), route_resources, limits
+    )
+    advice = []
+    if len(overflow) == len(route_resources):
+        advice.append(
+            "route %s does not fit a shard on its own, raise the limits"
+            % overflow.pop(0)[0]
+        )
+    if overflow:
+        advice.append(
+            "pin %s to another Shard"
+            % ", ".join("%s (%d resources, %d bytes)" % route for route in overflow)
+        )
+    raise ValueError(
+        "Route shard %s has %d resources and %d bytes, more than %d resources or "
+        "%d bytes; %s"
+        % (
+            shard_name,
+            len(template["Resources"]),
+            len(body.encode()),
+            limits["ShardMaxResources"],
+            limits["ShardMaxBytes"],
+            "; ".join(advice),
+        )
+    )
+
+
+def get_shard_key(stack_fqn, shard_name, body):
+    return "%s/%s/%s-%s.json" % (
+        SHARD_PREFIX,
+        stack_fqn,
+        shard_name,
+        hashlib.sha256(body.encode()).hexdigest()[:16],
+    )
+
+
+def upload_route_shards(context, provider, stack="lambdas", **kwargs):
+    # Renders the lambdas blueprint so the uploaded shards are the ones the
+    # build points at. ApiWiring is left out because the api outputs may not
+    # exist yet, and the shards take the API IDs as parameters anyway.
+    lambdas_stack = context.get_stack(stack)
+    env_dict = dict(lambdas_stack.definition.variables["env-dict"])
+    env_dict.pop("ApiWiring", None)
+    variable = Variable("env-dict", env_dict)
+    variable.resolve(context, provider)
+    blueprint = lambdas_stack.blueprint.__class__(
+        lambdas_stack.name, context, mappings=context.mappings
+    )
+    blueprint.resolve_variables([variable])
+    blueprint.render_template()
+    shards = blueprint.route_shards
+    s3_client = get_session(
+        context.config.stacker_bucket_region or provider.region
+    ).client("s3")
+
+    uploaded = []
+    for shard_name, body in shards:
+        key = get_shard_key(lambdas_stack.fqn, shard_name, body)
+        try:
+            s3_client.head_object(Bucket=context.bucket_name, Key=key)
+            continue
+        except ClientError:
+            pass
+        s3_client.put_object(
+            Bucket=context.bucket_name,
+            Key=key,
+            Body=body.encode(),
+            ContentType="application/json",
+        )
+        uploaded.append(shard_name)
+
+    logger.info(
+        "Uploaded route shards: %s (%d unchanged)",
+        ", ".join(uploaded) or "none",
+        len(shards) - len(uploaded),
+    )
+    return {"shards": ",".join(shard_name for shard_name, _ in shards)}